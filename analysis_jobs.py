@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# 后台 AI 分析任务队列：有界线程池执行分析/对话请求，页面只提交任务并轮询状态，不阻塞脚本线程。
+# 相同请求（同一个 key）只执行一次，多个会话共享；所有订阅的会话都放弃后任务自动取消。
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class AnalysisJob:
+    def __init__(self, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.status = QUEUED
+        self.partial = ""
+        self.result = None
+        self.error = None
+        self.subscribers = set()
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def progress(self):
+        # 已接收的字符数
+        return len(self.partial)
+
+    def append(self, text):
+        self.partial += text
+
+
+class AnalysisJobQueue:
+    def __init__(self, max_workers=4, max_pending=32, keep_finished=600):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis")
+        self._max_pending = max_pending
+        self._keep_finished = keep_finished
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._active = {}
+
+    def submit(self, key, fn, subscriber):
+        """提交任务 fn(job) -> (content, error)。相同 key 的任务未结束时直接复用，返回 (job, error)。"""
+        with self._lock:
+            self._prune()
+            job = self._active.get(key)
+            if job is not None:
+                job.subscribers.add(subscriber)
+                return job, None
+            if sum(1 for j in self._active.values() if j.status == QUEUED) >= self._max_pending:
+                return None, "分析队列已满，请稍后再试。"
+            job = AnalysisJob(key)
+            job.subscribers.add(subscriber)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            job.future = self._executor.submit(self._run, job, fn)
+            return job, None
+
+    def _run(self, job, fn):
+        with self._lock:
+            if job.cancelled:
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            content, error = fn(job)
+        except Exception as e:
+            content, error = None, str(e)
+        with self._lock:
+            if job.cancelled:
+                self._finish(job, CANCELLED)
+            elif error:
+                job.error = error
+                self._finish(job, FAILED)
+            else:
+                job.result = content
+                self._finish(job, DONE)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = job.finished_at or time.time()
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+
+    def _prune(self):
+        cutoff = time.time() - self._keep_finished
+        for job_id in [i for i, j in self._jobs.items() if j.status in FINISHED and j.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def release(self, job_id, subscriber):
+        """会话不再需要该任务；没有其他会话订阅时取消（排队中直接移除，运行中在下一个数据块处中止）。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return
+            job.subscribers.discard(subscriber)
+            if job.subscribers:
+                return
+            job._cancel.set()
+            if job.future.cancel() or job.status == QUEUED:
+                self._finish(job, CANCELLED)
+            elif self._active.get(job.key) is job:
+                # 运行中的任务稍后才会结束，先让出 key，避免新的相同请求复用一个已取消的任务
+                del self._active[job.key]
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
@@ -2,10 +2,19 @@ import streamlit as st
 import akshare as ak
 import pandas as pd
 import plotly.graph_objects as go
-from openai import OpenAI
 import os
-import datetime
-import baostock as bs
+import uuid
+import shared_cache
+from ohlcv_store import float_formats
+from ingestion import describe_source
+from market_calendar import ashare_cache_expiry, ashare_index_date
+from ashare_data import EMPTY_INDEX, get_security_index, search_security, get_ashare_frame
+from market_analysis import build_ashare_messages, get_analysis, stream_analysis, analysis_digest, credential_digest
+from analysis_jobs import AnalysisJobQueue, QUEUED, DONE, FAILED, CANCELLED, FINISHED
+from ensemble_analysis import (
+    ASHARE_DIRECTIONS, ASHARE_LEVELS,
+    load_endpoint_keys, parse_model_configs, run_ensemble, ensemble_digest, build_consensus, results_table
+)
 
 # 设置页面配置
 st.set_page_config(
@@ -35,175 +44,194 @@ if "ashare_analysis_result" not in st.session_state:
     st.session_state["ashare_analysis_result"] = None
 if "ashare_chat_messages" not in st.session_state:
     st.session_state["ashare_chat_messages"] = []
+if "ashare_ensemble_results" not in st.session_state:
+    st.session_state["ashare_ensemble_results"] = None
+if "ashare_analysis_job" not in st.session_state:
+    st.session_state["ashare_analysis_job"] = None
+if "ashare_chat_job" not in st.session_state:
+    st.session_state["ashare_chat_job"] = None
+if "ashare_ensemble_job" not in st.session_state:
+    st.session_state["ashare_ensemble_job"] = None
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+if "recorded_requests" not in st.session_state:
+    st.session_state["recorded_requests"] = set()
+
+# 预热命中率统计：每个会话对同一份数据只计一次，重新运行页面不重复计数；
+# 数据来自预热进程写入的共享缓存条目记为命中（包括本进程 cache_resource 中缓存的这类数据）
+def record_request(kind, key, warm):
+    if key not in st.session_state["recorded_requests"]:
+        st.session_state["recorded_requests"].add(key)
+        shared_cache.record(kind, warm)
+
+# 获取失败时抛出异常而不是返回错误：Streamlit 不缓存异常，下次重新运行会立即重试，而不是把错误缓存到 expires_at
+class FetchError(Exception):
+    pass
 
 # 辅助函数：根据输入查找股票代码
+# 证券列表由 get_security_index 缓存（含共享缓存，可由预热进程提前生成）
+@st.cache_resource(max_entries=4)
+def load_index(index_date):
+    index, hit_writer = get_security_index(index_date)
+    if index is None:
+        raise FetchError("证券列表获取失败")
+    return index, hit_writer == shared_cache.WARMER
+
 @st.cache_data(ttl=3600)
-def search_stock(keyword):
+def search_stock(keyword, index_date):
+    return search_security(load_index(index_date)[0], keyword)
+
+def find_stock(keyword):
+    index_date = ashare_index_date()
     try:
-        # 1. 获取所有A股股票列表
-        try:
-            stock_info_df = ak.stock_info_a_code_name()
-            # 尝试完全匹配代码
-            code_match = stock_info_df[stock_info_df['code'] == keyword]
-            if not code_match.empty:
-                return code_match.iloc[0]['code'], code_match.iloc[0]['name']
-            
-            # 尝试匹配名称
-            name_match = stock_info_df[stock_info_df['name'].str.contains(keyword)]
-            if not name_match.empty:
-                # 返回第一个匹配项
-                return name_match.iloc[0]['code'], name_match.iloc[0]['name']
-        except:
-            pass
-        
-        # 2. 如果A股没找到，尝试搜索ETF列表
-        try:
-            etf_df = ak.fund_etf_fund_daily_em()
-            # 尝试完全匹配ETF代码
-            etf_code_match = etf_df[etf_df['基金代码'] == keyword]
-            if not etf_code_match.empty:
-                return etf_code_match.iloc[0]['基金代码'], etf_code_match.iloc[0]['基金简称']
-            
-            # 尝试匹配ETF名称
-            etf_name_match = etf_df[etf_df['基金简称'].str.contains(keyword)]
-            if not etf_name_match.empty:
-                return etf_name_match.iloc[0]['基金代码'], etf_name_match.iloc[0]['基金简称']
-        except:
-            pass
-        
-        # 3. 如果都没找到，但输入的是6位数字，则直接返回（兜底策略）
-        code_candidate = keyword.strip()
-        if code_candidate.isdigit() and len(code_candidate) == 6:
-            return code_candidate, code_candidate
-            
-        return None, None
-    except Exception as e:
-        code_candidate = keyword.strip()
-        if code_candidate.isdigit() and len(code_candidate) == 6:
-            return code_candidate, code_candidate
-        return None, str(e)
+        _, warm = load_index(index_date)
+    except FetchError:
+        # 证券列表暂不可用时不缓存搜索结果，6 位代码仍可直接使用
+        return search_security(EMPTY_INDEX, keyword)
+    record_request("security_index", f"security_index:{index_date.isoformat()}", warm)
+    return search_stock(keyword, index_date)
 
 # 数据获取函数
-@st.cache_data(ttl=300)
-def fetch_ashare_data(symbol, days):
+# 使用 cache_resource 让所有会话共享同一份只读的紧凑数据，避免 cache_data 每次命中都反序列化复制
+# expires_at 是缓存键的一部分：只有到了下一次可能产生新 K 线的时刻（盘中刷新 / 下一交易日开盘）才会重新获取
+# 本进程未命中时先查共享缓存，命中预热进程 (cache_warmer.py) 写入的数据则无需现场请求
+@st.cache_resource(max_entries=256)
+def fetch_ashare_data(symbol, days, expires_at):
+    data, error, hit_writer = get_ashare_frame(symbol, days, expires_at)
+    if error:
+        raise FetchError(error)
+    return data, hit_writer == shared_cache.WARMER
+
+def load_data(fetch, *args):
     try:
-        end_date = datetime.datetime.now()
-        start_date = end_date - datetime.timedelta(days=days * 2)
-        
-        start_date_str = start_date.strftime("%Y%m%d")
-        end_date_str = end_date.strftime("%Y%m%d")
-        start_date_bs = start_date.strftime("%Y-%m-%d")
-        end_date_bs = end_date.strftime("%Y-%m-%d")
-        
-        try:
-            df = ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=start_date_str, end_date=end_date_str, adjust="qfq")
-        except:
-            df = pd.DataFrame()
-        
-        if df.empty and symbol.isdigit() and len(symbol) == 6:
-             try:
-                df = ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start_date_str, end_date=end_date_str, adjust="qfq")
-             except:
-                pass
-
-        if df.empty and symbol.isdigit() and len(symbol) == 6:
-            bs_symbol = None
-            if symbol.startswith(("6", "9")):
-                bs_symbol = f"sh.{symbol}"
-            elif symbol.startswith(("0", "2", "3")):
-                bs_symbol = f"sz.{symbol}"
-            if bs_symbol:
-                try:
-                    lg = bs.login()
-                    if lg.error_code == "0":
-                        rs = bs.query_history_k_data_plus(
-                            bs_symbol,
-                            "date,open,high,low,close,volume",
-                            start_date=start_date_bs,
-                            end_date=end_date_bs,
-                            frequency="d",
-                            adjustflag="2",
-                        )
-                        data_list = []
-                        while rs.error_code == "0" and rs.next():
-                            data_list.append(rs.get_row_data())
-                        if data_list:
-                            df = pd.DataFrame(data_list, columns=rs.fields)
-                    bs.logout()
-                except:
-                    pass
-
-        if df.empty:
-            return None, "未获取到数据，请检查股票/ETF代码是否正确或近期是否停牌。"
-            
-        if "日期" in df.columns:
-            df = df.rename(columns={
-                "日期": "timestamp",
-                "开盘": "open",
-                "最高": "high",
-                "最低": "low",
-                "收盘": "close",
-                "成交量": "volume"
-            })
-        else:
-            df = df.rename(columns={
-                "date": "timestamp",
-                "open": "open",
-                "high": "high",
-                "low": "low",
-                "close": "close",
-                "volume": "volume"
-            })
-        
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        # 只取最近 N 个交易日
-        df = df.tail(days)
-        
-        return df, None
-    except Exception as e:
+        data, warm = fetch(*args)
+    except FetchError as e:
         return None, str(e)
+    record_request("ohlcv", f"{fetch.__name__}:{args!r}", warm)
+    return data, None
 
-# AI 分析函数
-def analyze_market(api_key, base_url, model, df, symbol_name, symbol_code):
-    if not api_key:
-        return "请先在左侧侧边栏输入 DeepSeek API Key。"
-    
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
-    # 准备数据摘要
-    recent_data = df.to_string(index=False)
-    current_price = df['close'].iloc[-1]
-    
-    prompt = f"""
-    你是专业的 A 股证券分析师。请根据以下 {symbol_name} ({symbol_code}) 的近期市场数据（日线）进行分析。
-    当前价格: {current_price}
-    
-    近期数据 (OHLCV):
-    {recent_data}
-    
-    请完成以下任务：
-    1. 分析当前的市场趋势（上涨、下跌或震荡）。
-    2. 识别关键的支撑位和阻力位。
-    3. 结合成交量变化分析主力资金动向和市场情绪。
-    4. 给出明确的操作建议：【买入 / 卖出 / 持仓 / 空仓观望】。
-    5. 如果建议操作，请给出具体的【参考价位】和【止损位】。
-    
-    请注意 A 股市场特点（T+1 交易，涨跌幅限制等），用简洁专业的语言回答。
-    """
-    
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "你是一个资深的 A 股证券分析师，擅长技术分析和基本面判断。"},
-                {"role": "user", "content": prompt}
-            ],
-            stream=False
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"AI 分析请求失败: {str(e)}"
+# AI 分析函数（在后台任务线程中运行，不能调用 st.*）
+def analyze_market(api_key, base_url, model, messages, expires_at, job):
+    content, error, hit_writer = get_analysis(
+        api_key, base_url, model, messages, expires_at,
+        request=lambda: stream_analysis(api_key, base_url, model, messages, job.append, lambda: job.cancelled)
+    )
+    if not error:
+        # 相同请求的任务已合并，每个任务计一次
+        shared_cache.record("analysis", hit_writer == shared_cache.WARMER)
+    return content, error
+
+# 对话函数（在后台任务线程中运行）
+def answer_question(api_key, base_url, model, history, job):
+    return stream_analysis(api_key, base_url, model, history, job.append, lambda: job.cancelled)
+
+# 多模型对比（在后台任务线程中运行），每完成一个模型追加一行进度
+def compare_models(configs, messages, job):
+    def report(result, results):
+        status = "成功" if result["content"] else f"失败: {result['error']}"
+        job.append(f"- {result['label']}：{status}（{len(results)} / {len(configs)}）\n")
+
+    results = run_ensemble(
+        configs, messages, ASHARE_DIRECTIONS, ASHARE_LEVELS,
+        on_result=report, should_stop=lambda: job.cancelled
+    )
+    if job.cancelled:
+        return None, "已取消"
+    return results, None
+
+# 后台任务队列，所有会话共享一个有界线程池
+@st.cache_resource
+def get_job_queue():
+    return AnalysisJobQueue(max_workers=4, max_pending=32)
+
+job_queue = get_job_queue()
+
+def submit_job(slot, key, fn, inputs):
+    # key 含 API Key 的摘要：只合并同一个 Key 的相同请求，避免用别人的 Key 运行、消耗别人的 tokens
+    # 提交失败（队列已满）时显示提示并返回 False
+    job_ref = st.session_state[slot]
+    job, error = job_queue.submit(key, fn, st.session_state["session_id"])
+    if error:
+        st.warning(error)
+        return False
+    if job_ref and job_ref["id"] != job.id:
+        job_queue.release(job_ref["id"], st.session_state["session_id"])
+    st.session_state[slot] = {"id": job.id, "inputs": inputs}
+    return True
+
+def drop_unanswered_question():
+    # 回答未生成（取消或未能提交）时撤回最后一条提问，避免下次请求出现连续两条用户消息
+    messages = st.session_state["ashare_chat_messages"]
+    if messages and messages[-1]["role"] == "user":
+        messages.pop()
+
+def cancel_stale_jobs(inputs):
+    # 标的、数据或模型变化后，旧输入的任务已无意义，立即取消，避免继续消耗 tokens
+    for slot in ("ashare_analysis_job", "ashare_chat_job", "ashare_ensemble_job"):
+        job_ref = st.session_state[slot]
+        if job_ref and job_ref["inputs"] != inputs:
+            job_queue.release(job_ref["id"], st.session_state["session_id"])
+            st.session_state[slot] = None
+            if slot == "ashare_chat_job":
+                drop_unanswered_question()
+
+def cancel_job(slot):
+    job_queue.release(st.session_state[slot]["id"], st.session_state["session_id"])
+    st.session_state[slot] = None
+
+# 轮询后台任务状态，仅刷新此片段，任务结束后整页重新运行以展示结果
+@st.fragment(run_every=1)
+def show_analysis_job():
+    job_ref = st.session_state["ashare_analysis_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["ashare_analysis_job"] = None
+        if job is not None and job.status != CANCELLED:
+            st.session_state["ashare_analysis_result"] = job.result if job.status == DONE else f"AI 分析请求失败: {job.error}"
+            st.session_state["ashare_chat_messages"] = []
+        st.rerun()
+    if job.status == QUEUED:
+        st.info("分析任务排队中...")
+    else:
+        st.info(f"DeepSeek 正在思考中... 已接收 {job.progress} 字")
+        st.markdown(job.partial)
+    if st.button("取消分析"):
+        cancel_job("ashare_analysis_job")
+        st.rerun()
+
+@st.fragment(run_every=1)
+def show_chat_job():
+    job_ref = st.session_state["ashare_chat_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["ashare_chat_job"] = None
+        if job is not None and job.status != CANCELLED:
+            answer = job.result if job.status == DONE else f"对话请求失败: {job.error}"
+            st.session_state["ashare_chat_messages"].append({"role": "assistant", "content": answer})
+        else:
+            drop_unanswered_question()
+        st.rerun()
+    with st.chat_message("assistant"):
+        st.markdown(job.partial or "DeepSeek 正在回答...")
+
+@st.fragment(run_every=1)
+def show_ensemble_job():
+    job_ref = st.session_state["ashare_ensemble_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["ashare_ensemble_job"] = None
+        if job is not None and job.status in (DONE, FAILED):
+            # 与输入一起保存，切换标的或数据更新后不再展示旧的对比结果
+            st.session_state["ashare_ensemble_results"] = {"inputs": job_ref["inputs"], "results": job.result or [], "error": job.error}
+        st.rerun()
+    if job.status == QUEUED:
+        st.info("对比任务排队中...")
+    else:
+        st.info("正在并行请求各模型...")
+        st.markdown(job.partial)
+    if st.button("取消对比"):
+        cancel_job("ashare_ensemble_job")
+        st.rerun()
 
 # 主界面逻辑
 st.title("📈 A股 AI 投资顾问 (DeepSeek Powered)")
@@ -215,22 +243,29 @@ with col_days:
     days_back = st.slider("交易日数量", min_value=15, max_value=60, value=15)
 
 # 1. 股票搜索与确认
-real_code, real_name = search_stock(stock_input)
+real_code, real_name = find_stock(stock_input)
 
 if not real_code:
+    cancel_stale_jobs(None)
     st.error(f"未找到代码或名称包含 '{stock_input}' 的股票，请检查输入。")
 else:
     st.markdown(f"当前分析对象: **{real_name} ({real_code})** | 时间跨度: 近 {days_back} 个交易日")
     
     # 2. 获取数据
     with st.spinner("正在获取 A 股数据..."):
-        df, error = fetch_ashare_data(real_code, days_back)
+        expires_at = ashare_cache_expiry().isoformat()
+        data, error = load_data(fetch_ashare_data, real_code, days_back, expires_at)
+    
+    analysis_inputs = (real_code, days_back, data.fingerprint() if data is not None else None, base_url, model_name)
+    cancel_stale_jobs(analysis_inputs)
         
     if error:
         st.error(f"数据获取失败: {error}")
     else:
+        df = data.to_frame()
+        
         # 3. 展示图表
-        st.success(f"已更新 {len(df)} 条交易数据")
+        st.success(f"已更新 {len(df)} 条交易数据（数据源: {describe_source(data.meta)}）")
         
         fig = go.Figure(data=[go.Candlestick(x=df['timestamp'],
                         open=df['open'],
@@ -248,7 +283,10 @@ else:
         st.plotly_chart(fig, use_container_width=True)
         
         with st.expander("查看详细数据"):
-            st.dataframe(df.sort_values('timestamp', ascending=False))
+            st.dataframe(
+                df.sort_values('timestamp', ascending=False),
+                column_config={name: st.column_config.NumberColumn(format=fmt) for name, fmt in float_formats(df).items()}
+            )
             
         # 4. AI 分析
         st.divider()
@@ -258,14 +296,68 @@ else:
             if not api_key:
                 st.warning("⚠️ 请在侧边栏输入 DeepSeek API Key 以获取 AI 建议。")
             else:
-                with st.spinner("DeepSeek 正在思考中..."):
-                    analysis_result = analyze_market(api_key, base_url, model_name, df, real_name, real_code)
-                    st.session_state["ashare_analysis_result"] = analysis_result
-                    st.session_state["ashare_chat_messages"] = []
+                messages = build_ashare_messages(df, real_name, real_code)
+                submit_job(
+                    "ashare_analysis_job",
+                    ("analysis", credential_digest(api_key), analysis_digest(base_url, model_name, messages)),
+                    lambda job: analyze_market(api_key, base_url, model_name, messages, expires_at, job),
+                    analysis_inputs
+                )
+        
+        if st.session_state["ashare_analysis_job"]:
+            show_analysis_job()
         
         # 显示分析结果
         if st.session_state["ashare_analysis_result"]:
             st.markdown(st.session_state["ashare_analysis_result"])
+
+        # 多模型并行对比
+        with st.expander("🧪 多模型对比分析"):
+            ensemble_text = st.text_area(
+                "模型列表（每行一个）",
+                value=f"{model_name} | {base_url}",
+                help="格式：模型名称 | Base URL | 并发上限 | 超时(秒) | 输入单价 | 输出单价（单价为每百万 tokens，除模型名称外均可留空）。侧边栏的接口使用侧边栏的 Key，其他接口需在服务器端通过 ENSEMBLE_ENDPOINTS 配置"
+            )
+            variants_text = st.text_area("系统提示词变体（可选，每行一个）", value="")
+            if st.button("并行对比分析"):
+                variants = [v.strip() for v in variants_text.splitlines() if v.strip()]
+                configs, config_error = parse_model_configs(ensemble_text, api_key, base_url, variants, load_endpoint_keys())
+                if config_error:
+                    st.warning(config_error)
+                elif not configs:
+                    st.warning("请至少配置一个模型。")
+                else:
+                    ensemble_messages = build_ashare_messages(df, real_name, real_code)
+                    submit_job(
+                        "ashare_ensemble_job",
+                        ("ensemble", credential_digest(api_key), ensemble_digest(configs, ensemble_messages)),
+                        lambda job: compare_models(configs, ensemble_messages, job),
+                        analysis_inputs
+                    )
+
+            if st.session_state["ashare_ensemble_job"]:
+                show_ensemble_job()
+
+            ensemble = st.session_state["ashare_ensemble_results"]
+            if ensemble and ensemble["inputs"] == analysis_inputs:
+                if ensemble["error"]:
+                    st.error(f"对比分析失败: {ensemble['error']}")
+                results = ensemble["results"]
+                consensus = build_consensus(results, ASHARE_LEVELS)
+                col_dir, col_agree, col_cost, col_time = st.columns(4)
+                col_dir.metric("共识方向", consensus["direction"] or "无法判断")
+                col_agree.metric("一致率", f"{consensus['agreement']:.0%}")
+                col_cost.metric("总费用", f"{consensus['total_cost']:.4f}")
+                col_time.metric("墙钟耗时 / 串行耗时", f"{consensus['wall_time']:.1f}s / {consensus['sum_latency']:.1f}s")
+                if consensus["levels"]:
+                    st.dataframe(pd.DataFrame(consensus["levels"]).T.rename(columns={
+                        "median": "中位数", "min": "最低", "max": "最高", "count": "模型数"
+                    }))
+                st.dataframe(pd.DataFrame(results_table(results)))
+                for r in results:
+                    with st.container(border=True):
+                        st.markdown(f"**{r['label']}** · {r['latency']:.1f}s")
+                        st.markdown(r["content"] or f"请求失败: {r['error']}")
             
         # 5. 对话功能
         st.divider()
@@ -284,38 +376,35 @@ else:
                     else:
                         with st.chat_message("assistant"):
                             st.markdown(msg["content"])
+                if st.session_state["ashare_chat_job"]:
+                    show_chat_job()
             
-            user_question = st.chat_input("就当前 A 股分析继续提问...")
+            user_question = st.chat_input("就当前 A 股分析继续提问...", disabled=st.session_state["ashare_chat_job"] is not None)
             if user_question:
                 st.session_state["ashare_chat_messages"].append({"role": "user", "content": user_question})
                 
-                with st.spinner("DeepSeek 正在回答..."):
-                    client = OpenAI(api_key=api_key, base_url=base_url)
-                    history = [
-                        {
-                            "role": "system",
-                            "content": "你是一个资深的 A 股证券分析师。回答要结合之前的分析结论，并保持逻辑一致。"
-                        },
-                        {
-                            "role": "user",
-                            "content": f"下面是你刚刚给出的关于 {real_name} ({real_code}) 的市场分析结论：\n{st.session_state['ashare_analysis_result']}\n\n用户的追问会围绕这份分析展开，请据此回答。"
-                        }
-                    ]
-                    for m in st.session_state["ashare_chat_messages"]:
-                        history.append({"role": m["role"], "content": m["content"]})
-                    
-                    try:
-                        response = client.chat.completions.create(
-                            model=model_name,
-                            messages=history,
-                            stream=False
-                        )
-                        answer = response.choices[0].message.content
-                    except Exception as e:
-                        answer = f"对话请求失败: {str(e)}"
-                    
-                    st.session_state["ashare_chat_messages"].append({"role": "assistant", "content": answer})
+                history = [
+                    {
+                        "role": "system",
+                        "content": "你是一个资深的 A 股证券分析师。回答要结合之前的分析结论，并保持逻辑一致。"
+                    },
+                    {
+                        "role": "user",
+                        "content": f"下面是你刚刚给出的关于 {real_name} ({real_code}) 的市场分析结论：\n{st.session_state['ashare_analysis_result']}\n\n用户的追问会围绕这份分析展开，请据此回答。"
+                    }
+                ]
+                for m in st.session_state["ashare_chat_messages"]:
+                    history.append({"role": m["role"], "content": m["content"]})
+                
+                if submit_job(
+                    "ashare_chat_job",
+                    ("chat", credential_digest(api_key), analysis_digest(base_url, model_name, history)),
+                    lambda job: answer_question(api_key, base_url, model_name, history, job),
+                    analysis_inputs
+                ):
                     st.rerun()
+                else:
+                    drop_unanswered_question()
 
 # 页脚
 st.markdown("---")
@@ -0,0 +1,153 @@
+import akshare as ak
+import baostock as bs
+
+import shared_cache
+from ingestion import BAOSTOCK_FIELDS, parse_akshare, parse_baostock
+from market_calendar import ashare_fetch_range, ashare_index_date, ashare_index_expiry
+
+# A 股数据获取，不依赖 Streamlit，页面 (ashare_advisor.py) 与缓存预热进程 (cache_warmer.py) 共用
+
+
+EMPTY_INDEX = {"stocks": None, "etfs": None}
+
+
+def load_security_index():
+    """证券索引：全部 A 股代码/名称与 ETF 列表，供 search_security 匹配。"""
+    index = dict(EMPTY_INDEX)
+    try:
+        index["stocks"] = ak.stock_info_a_code_name()
+    except:
+        pass
+    try:
+        index["etfs"] = ak.fund_etf_fund_daily_em()
+    except:
+        pass
+    if index["stocks"] is None and index["etfs"] is None:
+        return index, "证券列表获取失败"
+    return index, None
+
+
+def get_security_index(index_date=None, writer=shared_cache.INTERACTIVE):
+    """证券列表按交易日缓存（见 ashare_index_date），在收盘后切换，不在开盘时失效。
+
+    返回 (index, hit_writer)，获取失败时 index 为 None（不缓存，下次重试）。
+    """
+    index_date = index_date or ashare_index_date()
+    expires_at = ashare_index_expiry(index_date)
+    index, error, hit_writer = shared_cache.get_or_fetch(
+        "security_index", f"security_index:{index_date.isoformat()}", expires_at, load_security_index, writer
+    )
+    return (None, None) if error else (index, hit_writer)
+
+
+def search_security(index, keyword):
+    try:
+        # 1. 在 A 股股票列表中查找
+        stock_info_df = index["stocks"]
+        if stock_info_df is not None:
+            # 尝试完全匹配代码
+            code_match = stock_info_df[stock_info_df['code'] == keyword]
+            if not code_match.empty:
+                return code_match.iloc[0]['code'], code_match.iloc[0]['name']
+            
+            # 尝试匹配名称
+            name_match = stock_info_df[stock_info_df['name'].str.contains(keyword)]
+            if not name_match.empty:
+                # 返回第一个匹配项
+                return name_match.iloc[0]['code'], name_match.iloc[0]['name']
+        
+        # 2. 如果A股没找到，尝试搜索ETF列表
+        etf_df = index["etfs"]
+        if etf_df is not None:
+            # 尝试完全匹配ETF代码
+            etf_code_match = etf_df[etf_df['基金代码'] == keyword]
+            if not etf_code_match.empty:
+                return etf_code_match.iloc[0]['基金代码'], etf_code_match.iloc[0]['基金简称']
+            
+            # 尝试匹配ETF名称
+            etf_name_match = etf_df[etf_df['基金简称'].str.contains(keyword)]
+            if not etf_name_match.empty:
+                return etf_name_match.iloc[0]['基金代码'], etf_name_match.iloc[0]['基金简称']
+        
+        # 3. 如果都没找到，但输入的是6位数字，则直接返回（兜底策略）
+        code_candidate = keyword.strip()
+        if code_candidate.isdigit() and len(code_candidate) == 6:
+            return code_candidate, code_candidate
+            
+        return None, None
+    except Exception as e:
+        code_candidate = keyword.strip()
+        if code_candidate.isdigit() and len(code_candidate) == 6:
+            return code_candidate, code_candidate
+        return None, str(e)
+
+
+def fetch_ashare_frame(symbol, days, now=None):
+    try:
+        # 按交易日历精确计算最近 N 个交易日的区间（now 用于预热进程在开盘前获取开盘时段的数据）
+        start_date, end_date = ashare_fetch_range(days, now)
+        
+        start_date_str = start_date.strftime("%Y%m%d")
+        end_date_str = end_date.strftime("%Y%m%d")
+        start_date_bs = start_date.strftime("%Y-%m-%d")
+        end_date_bs = end_date.strftime("%Y-%m-%d")
+        
+        # 依次尝试各数据源，统一由 ingestion 解析为同一结构
+        frame = None
+        try:
+            df = ak.stock_zh_a_hist(symbol=symbol, period="daily", start_date=start_date_str, end_date=end_date_str, adjust="qfq")
+            if not df.empty:
+                frame = parse_akshare(df, symbol, "akshare.stock_zh_a_hist", "qfq")
+        except:
+            pass
+        
+        if frame is None and symbol.isdigit() and len(symbol) == 6:
+             try:
+                df = ak.fund_etf_hist_em(symbol=symbol, period="daily", start_date=start_date_str, end_date=end_date_str, adjust="qfq")
+                if not df.empty:
+                    frame = parse_akshare(df, symbol, "akshare.fund_etf_hist_em", "qfq")
+             except:
+                pass
+
+        if frame is None and symbol.isdigit() and len(symbol) == 6:
+            bs_symbol = None
+            if symbol.startswith(("6", "9")):
+                bs_symbol = f"sh.{symbol}"
+            elif symbol.startswith(("0", "2", "3")):
+                bs_symbol = f"sz.{symbol}"
+            if bs_symbol:
+                try:
+                    lg = bs.login()
+                    if lg.error_code == "0":
+                        rs = bs.query_history_k_data_plus(
+                            bs_symbol,
+                            BAOSTOCK_FIELDS,
+                            start_date=start_date_bs,
+                            end_date=end_date_bs,
+                            frequency="d",
+                            adjustflag="2",
+                        )
+                        data_list = []
+                        while rs.error_code == "0" and rs.next():
+                            data_list.append(rs.get_row_data())
+                        if data_list:
+                            frame = parse_baostock(data_list, rs.fields, symbol, "qfq")
+                    bs.logout()
+                except:
+                    pass
+
+        if frame is None or len(frame) == 0:
+            return None, "未获取到数据，请检查股票/ETF代码是否正确或近期是否停牌。"
+        
+        # 只取最近 N 个交易日
+        return frame.tail(days), None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_ashare_frame(symbol, days, expires_at, writer=shared_cache.INTERACTIVE, now=None):
+    """先查共享缓存（可能已由预热进程写入），未命中再从数据源获取。返回 (frame, error, hit_writer)。"""
+    return shared_cache.get_or_fetch(
+        "ohlcv", f"ohlcv:ashare:{symbol}:{days}:{expires_at}", expires_at,
+        lambda: fetch_ashare_frame(symbol, days, now), writer
+    )
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from ohlcv_store import OHLCVFrame
+from ingestion import BAOSTOCK_COLUMNS, parse_akshare, parse_baostock, parse_ccxt, parse_coingecko
+
+# 对比各数据源原来的临时 pandas 处理方式与 ingestion 向量化解析器在大数据量下的吞吐量。
+# 用法：python bench_ingestion.py
+
+
+def make_payloads(rows):
+    rng = np.random.default_rng(0)
+    ts_ms = 1_500_000_000_000 + np.arange(rows, dtype=np.int64) * 60_000
+    close = np.round(100 + rng.standard_normal(rows).cumsum() * 0.1, 2)
+    volume = np.round(rng.random(rows) * 1000, 3)
+    ccxt_rows = [[int(t), c, c + 0.5, c - 0.5, c, v] for t, c, v in zip(ts_ms, close, volume)]
+    coingecko = ([[int(t), c] for t, c in zip(ts_ms, close)], [[int(t), v] for t, v in zip(ts_ms, volume)])
+    dates = pd.date_range("1990-01-01", periods=rows, freq="D").strftime("%Y-%m-%d")
+    akshare = pd.DataFrame({
+        "日期": dates, "开盘": close, "收盘": close, "最高": close + 0.5, "最低": close - 0.5,
+        "成交量": (volume * 100).astype(np.int64), "成交额": volume * 1e4, "涨跌幅": np.round(rng.standard_normal(rows), 2),
+        "换手率": np.round(rng.random(rows), 2),
+    })
+    fields = list(BAOSTOCK_COLUMNS)
+    baostock = [
+        [d, f"{c:.2f}", f"{c + 0.5:.2f}", f"{c - 0.5:.2f}", f"{c:.2f}", str(int(v * 100)), f"{v * 1e4:.2f}", "0.5", "0.3"]
+        for d, c, v in zip(dates, close, volume)
+    ]
+    return ccxt_rows, coingecko, akshare, (baostock, fields)
+
+
+# 原来的 OHLCVFrame.from_dataframe（各数据源统一改用 ingestion 后已移除），仅作为对比基准保留在这里
+LEGACY_NUMERIC_COLUMNS = ("open", "high", "low", "close", "volume")
+
+
+def legacy_from_dataframe(df):
+    timestamps = pd.to_datetime(df['timestamp']).to_numpy(dtype="datetime64[ns]").view(np.int64)
+    data = {}
+    for name in df.columns:
+        series = df[name]
+        if name == 'timestamp':
+            continue
+        if name in LEGACY_NUMERIC_COLUMNS and (series.dtype == object or pd.api.types.is_string_dtype(series)):
+            # baostock 返回的是字符串，这里统一转成数字
+            series = pd.to_numeric(series, errors="coerce")
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            data[name] = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    return OHLCVFrame.from_columns(timestamps, data)
+
+
+# 原来各 fetch 函数中的处理方式，之后统一经 from_dataframe 压缩后放入缓存
+def legacy_ccxt(ohlcv):
+    df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return legacy_from_dataframe(df)
+
+
+def legacy_coingecko(prices, volumes):
+    df_p = pd.DataFrame(prices, columns=['timestamp', 'price'])
+    df_v = pd.DataFrame(volumes, columns=['timestamp', 'volume'])
+    df = pd.merge(df_p, df_v, on='timestamp', how='left')
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    rs = df.set_index('timestamp').resample('1h').agg({'price': ['first', 'max', 'min', 'last'], 'volume': 'sum'})
+    rs.columns = ['open', 'high', 'low', 'close', 'volume']
+    return legacy_from_dataframe(rs.dropna().reset_index())
+
+
+def legacy_akshare(df):
+    df = df.rename(columns={"日期": "timestamp", "开盘": "open", "最高": "high", "最低": "low", "收盘": "close", "成交量": "volume"})
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return legacy_from_dataframe(df)
+
+
+def legacy_baostock(rows, fields):
+    # 字符串在 legacy_from_dataframe 中转换成数字
+    df = pd.DataFrame(rows, columns=fields).rename(columns={"date": "timestamp"})
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    return legacy_from_dataframe(df)
+
+
+def timeit(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    for rows in (10_000, 1_000_000):
+        ccxt_rows, (prices, volumes), akshare, (baostock, fields) = make_payloads(rows)
+        cases = [
+            ("ccxt", lambda: legacy_ccxt(ccxt_rows), lambda: parse_ccxt(ccxt_rows, "BTC/USDT", "1m")),
+            ("CoinGecko", lambda: legacy_coingecko(prices, volumes), lambda: parse_coingecko(prices, volumes, "BTC/USDT", "1h", "usd")),
+            ("akshare", lambda: legacy_akshare(akshare), lambda: parse_akshare(akshare, "600519", "akshare.stock_zh_a_hist", "qfq")),
+            ("baostock", lambda: legacy_baostock(baostock, fields), lambda: parse_baostock(baostock, fields, "sh.600519", "qfq")),
+        ]
+        print(f"{rows} 行")
+        for name, legacy, parser in cases:
+            old, new = timeit(legacy), timeit(parser)
+            print(f"  {name:10s} 原方式 {rows / old / 1e6:7.2f} M 行/秒 | ingestion {rows / new / 1e6:7.2f} M 行/秒 | {old / new:5.2f}x")
@@ -0,0 +1,71 @@
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from ingestion import BAOSTOCK_COLUMNS, parse_baostock, parse_ccxt
+
+# 对比 st.cache_data（每次命中反序列化一份副本）与 OHLCVFrame + st.cache_resource（共享只读视图）
+# 的单会话内存占用和缓存命中耗时。缓存的是 ingestion 解析后的真实数据：
+# 加密货币按 UTC 展示，A 股 (baostock) 带 tz=Asia/Shanghai 元数据。用法：python bench_ohlcv_store.py
+
+
+def make_ccxt_frame(rows):
+    rng = np.random.default_rng(0)
+    close = np.round(60000 + rng.standard_normal(rows).cumsum() * 50, 1)
+    ts = 1_700_000_000_000 + np.arange(rows, dtype=np.int64) * 3_600_000
+    volume = np.round(rng.random(rows) * 1000, 3)
+    ohlcv = np.column_stack([ts, close, close + 25.5, close - 25.5, close, volume])
+    return parse_ccxt(ohlcv, "BTC/USDT", "1h")
+
+
+def make_baostock_frame(rows):
+    # baostock 的 get_row_data() 返回的全部是字符串
+    rng = np.random.default_rng(0)
+    close = 100 + rng.standard_normal(rows).cumsum() * 0.1
+    volume = (rng.random(rows) * 1e6).astype(np.int64)
+    dates = pd.date_range("1990-01-01", periods=rows, freq="D").strftime("%Y-%m-%d")
+    data = [
+        [d, f"{c:.2f}", f"{c + 0.5:.2f}", f"{c - 0.5:.2f}", f"{c:.2f}", str(v), f"{v * c:.2f}", "0.5", "0.3"]
+        for d, c, v in zip(dates, close, volume)
+    ]
+    return parse_baostock(data, list(BAOSTOCK_COLUMNS), "sh.600519", "qfq")
+
+
+def timeit(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(name, frame, repeat=20):
+    # cache_data 缓存的是页面拿到的 DataFrame，每次命中都反序列化一份副本
+    df = frame.to_frame()
+    payload = pickle.dumps(df)
+
+    copy_bytes = pickle.loads(payload).memory_usage(deep=True).sum()
+    copy_time = timeit(lambda: pickle.loads(payload), repeat)
+    view = frame.to_frame()
+    # 视图与缓存共享内存（包括按时区转换后只算一次的当地时间列），每个会话新增的只有 DataFrame 自身的对象开销；
+    # 若某列没有共享而是被复制，按实际大小计入
+    shared = list(frame.columns.values()) + [frame.local_times()]
+    view_bytes = sum(
+        0 if any(np.shares_memory(view[c].to_numpy(), arr) for arr in shared) else view[c].memory_usage(deep=True)
+        for c in view.columns
+    )
+    view_time = timeit(frame.to_frame, repeat)
+
+    print(f"{name} ({len(frame)} 行)")
+    print(f"  缓存数据大小:   cache_data {len(payload) / 1024:10.1f} KB | OHLCVFrame {frame.nbytes / 1024:10.1f} KB")
+    print(f"  每会话新增内存: cache_data {copy_bytes / 1024:10.1f} KB | OHLCVFrame {view_bytes / 1024:10.1f} KB")
+    print(f"  缓存命中耗时:   cache_data {copy_time * 1e3:10.3f} ms | OHLCVFrame {view_time * 1e3:10.3f} ms")
+
+
+if __name__ == '__main__':
+    for rows in (60, 10_000, 500_000):
+        bench('ccxt 数据 (UTC)', make_ccxt_frame(rows))
+        bench('baostock 数据 (Asia/Shanghai)', make_baostock_frame(rows))
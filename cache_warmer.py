@@ -0,0 +1,243 @@
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import shared_cache
+from market_calendar import (
+    CST, TIMEFRAME_SECONDS, ashare_cache_expiry, ashare_index_date, ashare_next_open, crypto_cache_expiry
+)
+from market_analysis import build_ashare_messages, build_crypto_messages, get_analysis
+
+# 缓存预热进程：按计划为自选列表提前获取行情、证券索引并生成 AI 分析，写入共享缓存 (shared_cache.py)，
+# 高峰时段页面的交互请求直接命中预热结果。
+# 行情在页面缓存键失效后立即预热（见 market_calendar 的 *_cache_expiry）：A 股盘中（含收盘后修正时段）
+# 每 5 分钟、午休前及收盘后各一次，加密货币每 5 分钟（或 K 线收盘时）。A 股另在集合竞价结束后（09:26）
+# 预先写入 09:30 开始的第一个时段的数据，证券列表在收盘后的运行中切换到下一交易日，开盘时全部直接命中。
+# AI 分析只在 A 股开盘前、收盘后以及加密货币每根 K 线收盘时生成，盘中的定时刷新只预热行情。
+#
+# 用法：
+#   python cache_warmer.py --config watchlist.json          # 常驻，按计划运行
+#   python cache_warmer.py --config watchlist.json --once   # 立即运行一次所有任务
+#   python cache_warmer.py --report                         # 查看预热命中率
+#
+# 配置示例 (watchlist.json)，字段均可省略：
+# {
+#   "ashare": {"symbols": ["600519", "000001"], "days": 15},
+#   "crypto": {"symbols": ["BTC/USDT"], "timeframes": ["1h"], "days": 3, "source": "Binance Futures"},
+#   "analysis": {"enabled": true, "model": "deepseek-chat", "base_url": "https://api.deepseek.com", "concurrency": 4},
+#   "proxies": null
+# }
+# 参数默认值与页面默认值一致，否则缓存键不同、预热结果无法命中。
+
+DEFAULT_CONFIG = {
+    "ashare": {"symbols": [], "days": 15},
+    "crypto": {"symbols": [], "timeframes": ["1h"], "days": 3, "source": "Binance Futures"},
+    "analysis": {"enabled": True, "model": "deepseek-chat", "base_url": "https://api.deepseek.com", "concurrency": 4},
+    "proxies": None,
+}
+
+# 缓存失效（K 线收盘或定时刷新）后稍等片刻再获取，确保数据源已生成新 K 线
+CANDLE_SETTLE = 5
+# A 股开盘前的预热时刻：集合竞价 (09:15-09:25) 结束后
+PREOPEN_RUN = datetime.time(9, 26)
+
+
+def load_config(path):
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path:
+        with open(path, encoding="utf-8") as f:
+            user_config = json.load(f)
+        for section, values in user_config.items():
+            if isinstance(values, dict):
+                config.setdefault(section, {}).update(values)
+            else:
+                config[section] = values
+    return config
+
+
+def warm_analyses(config, pending, expires_at):
+    """并发生成分析，pending 为各标的的提示词，返回与之对应的状态列表。"""
+    analysis = config["analysis"]
+    api_key = os.getenv("DEEPSEEK_API_KEY", "")
+    if not pending or not analysis.get("enabled") or not api_key:
+        return [None] * len(pending)
+
+    def warm_one(messages):
+        _, error, hit = get_analysis(
+            api_key, analysis["base_url"], analysis["model"], messages, expires_at, writer=shared_cache.WARMER
+        )
+        return "失败: " + error if error else ("已存在" if hit else "已生成")
+
+    with ThreadPoolExecutor(max_workers=max(1, analysis["concurrency"])) as pool:
+        return list(pool.map(warm_one, pending))
+
+
+def warm_ashare(config, target):
+    """写入页面在 target 时刻会读取的缓存键（开盘前的预热以开盘时刻为 target）。
+
+    只获取行情，返回 (report, pending)：pending 为 [(report 中的行, 分析提示词)]，由 run_job 统一生成分析。
+    """
+    # 仅 A 股任务需要 akshare，延迟导入
+    from ashare_data import EMPTY_INDEX, get_security_index, search_security, get_ashare_frame
+
+    section = config["ashare"]
+    index, _ = get_security_index(ashare_index_date(target), writer=shared_cache.WARMER)
+    index = index or EMPTY_INDEX
+    expires_at = ashare_cache_expiry(target).isoformat()
+    report, pending = [], []
+    for keyword in section["symbols"]:
+        code, name = search_security(index, keyword)
+        if not code:
+            report.append([keyword, f"未找到: {name}" if name else "未找到", None])
+            continue
+        frame, error, hit = get_ashare_frame(code, section["days"], expires_at, writer=shared_cache.WARMER, now=target)
+        if error:
+            report.append([code, f"失败: {error}", None])
+            continue
+        row = [code, "已存在" if hit else "已获取", None]
+        report.append(row)
+        pending.append((row, build_ashare_messages(frame.to_frame(), name, code)))
+    return report, pending
+
+
+def warm_crypto(config, timeframe, target):
+    from crypto_data import get_binance_frame, get_coingecko_frame
+
+    section = config["crypto"]
+    expires_at = crypto_cache_expiry(timeframe, target).isoformat()
+    report, pending = [], []
+    for symbol in section["symbols"]:
+        args = (symbol, timeframe, section["days"], expires_at, config["proxies"])
+        if section["source"] == "Binance Futures":
+            frame, error, hit = get_binance_frame(*args, writer=shared_cache.WARMER)
+            if error:
+                # 与页面一致：币安不可用时切换到 CoinGecko
+                frame, error, hit = get_coingecko_frame(*args, writer=shared_cache.WARMER)
+        else:
+            frame, error, hit = get_coingecko_frame(*args, writer=shared_cache.WARMER)
+        if error:
+            report.append([f"{symbol} {timeframe}", f"失败: {error}", None])
+            continue
+        row = [f"{symbol} {timeframe}", "已存在" if hit else "已获取", None]
+        report.append(row)
+        pending.append((row, build_crypto_messages(frame.to_frame(), symbol, timeframe)))
+    return report, pending
+
+
+def next_ashare_run(now):
+    """下一次 A 股预热的 (运行时刻, 目标时刻, 是否生成分析)。
+
+    页面的缓存键在 ashare_cache_expiry 时刻失效，此时重新预热，使整个交易时段都有预热结果；
+    开盘前另在 PREOPEN_RUN 以开盘时刻为目标预热，开盘后第一个时段的请求直接命中。
+    分析只在开盘前和收盘后（数据缓存到下一次开盘）生成。
+    """
+    expiry = ashare_cache_expiry(now)
+    run_at = expiry + datetime.timedelta(seconds=CANDLE_SETTLE)
+    open_at = ashare_next_open(now)
+    preopen = datetime.datetime.combine(open_at.date(), PREOPEN_RUN, tzinfo=CST)
+    if now < preopen < run_at:
+        return preopen, open_at, True
+    return run_at, run_at, ashare_cache_expiry(run_at) == ashare_next_open(run_at)
+
+
+def next_crypto_run(timeframe, now):
+    """下一次加密货币预热的 (运行时刻, 目标时刻, 是否生成分析)，分析只在 K 线收盘时生成。"""
+    expiry = crypto_cache_expiry(timeframe, now)
+    run_at = expiry + datetime.timedelta(seconds=CANDLE_SETTLE)
+    return run_at, run_at, int(expiry.timestamp()) % TIMEFRAME_SECONDS[timeframe] == 0
+
+
+def print_report(job, report):
+    print(f"[{datetime.datetime.now(CST):%Y-%m-%d %H:%M:%S}] {job}")
+    for name, data_status, analysis_status in report:
+        line = f"  {name}: 行情{data_status}"
+        if analysis_status:
+            line += f"，分析{analysis_status}"
+        print(line)
+    print_stats()
+
+
+def print_stats():
+    stats = shared_cache.stats()
+    if not stats:
+        print("  预热命中率: 暂无交互请求")
+        return
+    for kind, s in stats.items():
+        print(f"  预热命中率 [{kind}]: {s['ratio']:.1%} (命中预热 {s['warm']} / 未预热 {s['cold']})")
+
+
+def run_job(config, job, target, analyse=True):
+    market, timeframe = job
+    if market == "ashare":
+        title, expires_at = "A 股", ashare_cache_expiry(target)
+        report, pending = warm_ashare(config, target)
+    else:
+        title, expires_at = f"加密货币 {timeframe}", crypto_cache_expiry(timeframe, target)
+        report, pending = warm_crypto(config, timeframe, target)
+    # 先写入全部行情，再并发生成分析：行情预热不必等待前面标的的分析
+    if not analyse:
+        pending = []
+    statuses = warm_analyses(config, [messages for _, messages in pending], expires_at.isoformat())
+    for (row, _), status in zip(pending, statuses):
+        row[2] = status
+    print_report(title, report)
+    if datetime.datetime.now(CST) > expires_at:
+        print("  警告: 本次预热耗时超过缓存时段，结果未能及时生效，请减少自选列表或提高 analysis.concurrency")
+    shared_cache.purge_expired()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="行情与 AI 分析缓存预热")
+    parser.add_argument("--config", help="自选列表配置文件 (JSON)")
+    parser.add_argument("--once", action="store_true", help="立即运行一次所有任务后退出")
+    parser.add_argument("--report", action="store_true", help="打印预热命中率后退出")
+    parser.add_argument("--reset-stats", action="store_true", help="清空命中率统计")
+    args = parser.parse_args()
+
+    if args.reset_stats:
+        shared_cache.reset_stats()
+    if args.report:
+        print_stats()
+        return
+
+    config = load_config(args.config)
+    jobs = []
+    if config["ashare"]["symbols"]:
+        jobs.append(("ashare", None))
+    for timeframe in config["crypto"]["timeframes"] if config["crypto"]["symbols"] else []:
+        if timeframe not in TIMEFRAME_SECONDS:
+            parser.error(f"不支持的时间粒度: {timeframe}")
+        jobs.append(("crypto", timeframe))
+    if not jobs:
+        parser.error("自选列表为空，请在配置文件中设置 ashare.symbols 或 crypto.symbols")
+
+    if args.once:
+        for job in jobs:
+            run_job(config, job, datetime.datetime.now(CST))
+        return
+
+    def next_run(job, now):
+        if job[0] == "ashare":
+            return next_ashare_run(now)
+        return next_crypto_run(job[1], now)
+
+    now = datetime.datetime.now(CST)
+    schedule = {job: next_run(job, now) for job in jobs}
+    while True:
+        job = min(schedule, key=lambda j: schedule[j][0])
+        run_at, target, analyse = schedule[job]
+        wait = (run_at - datetime.datetime.now(CST)).total_seconds()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            run_job(config, job, target, analyse)
+        except Exception as e:
+            print(f"任务 {job} 运行失败: {e}")
+        schedule[job] = next_run(job, datetime.datetime.now(CST))
+
+
+if __name__ == "__main__":
+    main()
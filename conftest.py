@@ -0,0 +1,2 @@
+# test_ccxt*.py / test_connect_simple.py 是需要联网的手动检查脚本，导入时就会发请求，不由 pytest 收集
+collect_ignore = ["test_ccxt.py", "test_ccxt_manual.py", "test_connect_simple.py"]
@@ -2,10 +2,19 @@ import streamlit as st
 import ccxt
 import pandas as pd
 import plotly.graph_objects as go
-from openai import OpenAI
-import datetime
-import requests
 import os
+import uuid
+import shared_cache
+from ohlcv_store import float_formats
+from ingestion import describe_source
+from market_calendar import crypto_cache_expiry
+from crypto_data import get_binance_frame, get_coingecko_frame
+from market_analysis import build_crypto_messages, get_analysis, stream_analysis, analysis_digest, credential_digest
+from analysis_jobs import AnalysisJobQueue, QUEUED, DONE, FAILED, CANCELLED, FINISHED
+from ensemble_analysis import (
+    CRYPTO_DIRECTIONS, CRYPTO_LEVELS,
+    load_endpoint_keys, parse_model_configs, run_ensemble, ensemble_digest, build_consensus, results_table
+)
 
 # 设置页面配置
 st.set_page_config(
@@ -36,6 +45,25 @@ if "analysis_result" not in st.session_state:
     st.session_state["analysis_result"] = None
 if "chat_messages" not in st.session_state:
     st.session_state["chat_messages"] = []
+if "ensemble_results" not in st.session_state:
+    st.session_state["ensemble_results"] = None
+if "analysis_job" not in st.session_state:
+    st.session_state["analysis_job"] = None
+if "chat_job" not in st.session_state:
+    st.session_state["chat_job"] = None
+if "ensemble_job" not in st.session_state:
+    st.session_state["ensemble_job"] = None
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = uuid.uuid4().hex
+if "recorded_requests" not in st.session_state:
+    st.session_state["recorded_requests"] = set()
+
+# 预热命中率统计：每个会话对同一份数据只计一次，重新运行页面不重复计数；
+# 数据来自预热进程写入的共享缓存条目记为命中（包括本进程 cache_resource 中缓存的这类数据）
+def record_request(kind, key, warm):
+    if key not in st.session_state["recorded_requests"]:
+        st.session_state["recorded_requests"].add(key)
+        shared_cache.record(kind, warm)
 
 # 网络代理配置
 st.sidebar.subheader("网络设置")
@@ -63,163 +91,157 @@ if st.sidebar.button("测试连接"):
         st.sidebar.error(f"连接失败: {str(e)}")
 
 # 缓存数据获取函数
-@st.cache_data(ttl=300)
-def fetch_binance_data(symbol, timeframe, days, proxies=None):
-    try:
-        config = {
-            'enableRateLimit': True,
-            'options': {
-                'defaultType': 'future',  # 永续合约
-            }
-        }
-        if proxies:
-            config['proxies'] = proxies
-            
-        exchange = ccxt.binance(config)
-        
-        # 强制只使用期货 API，避免访问 Spot API (api.binance.com)
-        # 必须保留 fapiPublic/fapiPrivate，否则 fetch_ohlcv 无法找到对应的 URL
-        exchange.urls['api'] = {
-            'public': 'https://fapi.binance.com/fapi/v1',
-            'private': 'https://fapi.binance.com/fapi/v1',
-            'fapiPublic': 'https://fapi.binance.com/fapi/v1',
-            'fapiPrivate': 'https://fapi.binance.com/fapi/v1',
-        }
-        
-        # 手动注入市场数据，欺骗 ccxt 认为市场已加载，从而跳过 exchangeInfo 请求
-        # 针对 Binance Futures，BTC/USDT 对应的 id 是 BTCUSDT
-        market_id = symbol.replace('/', '')
-        exchange.markets = {
-            symbol: {
-                'id': market_id,
-                'symbol': symbol,
-                'base': symbol.split('/')[0],
-                'quote': symbol.split('/')[1],
-                'active': True,
-                'type': 'future',
-                'spot': False,
-                'future': True,
-                'swap': True, 
-                'linear': True,
-                'inverse': False,  # USDT 合约通常是正向合约 (linear)，不是反向合约 (inverse)
-                'contract': True,
-                'option': False,
-                'margin': False,
-            }
-        }
-        exchange.markets_by_id = {
-            market_id: exchange.markets[symbol]
-        }
-        
-        # 计算起始时间
-        since = exchange.milliseconds() - days * 24 * 60 * 60 * 1000
-        
-        # 直接调用 fetch_ohlcv，此时 markets 已有数据，不会触发 load_markets
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since)
-        
-        if not ohlcv:
-            return None, "未获取到数据，请检查交易对名称是否正确。"
-            
-        # 转换为 DataFrame
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        
-        return df, None
-    except Exception as e:
-        return None, str(e)
+# 使用 cache_resource 让所有会话共享同一份只读的紧凑数据，避免 cache_data 每次命中都反序列化复制
+# expires_at 是缓存键的一部分：未收盘的 K 线按固定间隔刷新，K 线收盘时立即刷新
+# 本进程未命中时先查共享缓存，命中预热进程 (cache_warmer.py) 写入的数据则无需现场请求
+# 获取失败时抛出异常而不是返回错误：Streamlit 不缓存异常，下次重新运行会立即重试（包括币安恢复后不再一直切换到 CoinGecko）
+class FetchError(Exception):
+    pass
 
-@st.cache_data(ttl=300)
-def fetch_coingecko_data(symbol, timeframe, days, proxies=None):
+@st.cache_resource(max_entries=256)
+def fetch_binance_data(symbol, timeframe, days, expires_at, proxies=None):
+    data, error, hit_writer = get_binance_frame(symbol, timeframe, days, expires_at, proxies)
+    if error:
+        raise FetchError(error)
+    return data, hit_writer == shared_cache.WARMER
+
+@st.cache_resource(max_entries=256)
+def fetch_coingecko_data(symbol, timeframe, days, expires_at, proxies=None):
+    data, error, hit_writer = get_coingecko_frame(symbol, timeframe, days, expires_at, proxies)
+    if error:
+        raise FetchError(error)
+    return data, hit_writer == shared_cache.WARMER
+
+def load_data(fetch, *args):
     try:
-        base, quote = symbol.split('/')
-        vs_map = {'USDT': 'usd', 'USD': 'usd', 'USDC': 'usd', 'CNY': 'cny', 'EUR': 'eur'}
-        vs_currency = vs_map.get(quote.upper(), 'usd')
-        mapping = {
-            'BTC': 'bitcoin', 'ETH': 'ethereum', 'BNB': 'binancecoin', 'SOL': 'solana',
-            'ADA': 'cardano', 'XRP': 'ripple', 'DOGE': 'dogecoin', 'TRX': 'tron',
-            'DOT': 'polkadot', 'AVAX': 'avalanche', 'LINK': 'chainlink', 'MATIC': 'polygon'
-        }
-        coin_id = mapping.get(base.upper())
-        if not coin_id:
-            r_list = requests.get(
-                'https://api.coingecko.com/api/v3/coins/list',
-                params={'include_platform': 'false'},
-                proxies=proxies,
-                timeout=8000
-            )
-            r_list.raise_for_status()
-            items = r_list.json()
-            coin_id = next((i['id'] for i in items if i.get('symbol', '').lower() == base.lower()), None)
-        if not coin_id:
-            return None, "无法解析交易对到 CoinGecko 资产。"
-        r = requests.get(
-            f'https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart',
-            params={'vs_currency': vs_currency, 'days': days},
-            proxies=proxies,
-            timeout=10000
-        )
-        r.raise_for_status()
-        data = r.json()
-        prices = data.get('prices', [])
-        volumes = data.get('total_volumes', [])
-        if not prices:
-            return None, "未获取到 CoinGecko 市场数据。"
-        df_p = pd.DataFrame(prices, columns=['timestamp', 'price'])
-        df_v = pd.DataFrame(volumes, columns=['timestamp', 'volume'])
-        df = pd.merge(df_p, df_v, on='timestamp', how='left')
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        freq_map = {'1h': '1H', '4h': '4H', '1d': '1D'}
-        freq = freq_map.get(timeframe, '1H')
-        rs = df.set_index('timestamp').resample(freq).agg({'price': ['first', 'max', 'min', 'last'], 'volume': 'sum'})
-        rs.columns = ['open', 'high', 'low', 'close', 'volume']
-        rs = rs.dropna()
-        rs = rs.reset_index()
-        return rs[['timestamp', 'open', 'high', 'low', 'close', 'volume']], None
-    except Exception as e:
+        data, warm = fetch(*args)
+    except FetchError as e:
         return None, str(e)
+    record_request("ohlcv", f"{fetch.__name__}:{args!r}", warm)
+    return data, None
 
-# AI 分析函数
-def analyze_market(api_key, base_url, model, df, symbol):
-    if not api_key:
-        return "请先在左侧侧边栏输入 DeepSeek API Key。"
-    
-    client = OpenAI(api_key=api_key, base_url=base_url)
-    
-    # 准备数据摘要，避免 token 过多
-    # 取最近的 N 条数据
-    recent_data = df.tail(24).to_string(index=False)
-    
-    current_price = df['close'].iloc[-1]
-    
-    prompt = f"""
-    你是专业的加密货币交易分析师。请根据以下 {symbol} 的近期市场数据（时间周期：{timeframe}）进行分析。
-    当前价格: {current_price}
-    
-    近期数据 (OHLCV):
-    {recent_data}
-    
-    请完成以下任务：
-    1. 分析当前的市场趋势（上涨、下跌或震荡）。
-    2. 识别关键的支撑位和阻力位。
-    3. 结合成交量变化分析市场情绪。
-    4. 给出明确的操作建议：【做多 / 做空 / 观望】。
-    5. 如果建议操作，请给出具体的【入场位】、【止损位】和【止盈位】。
-    
-    请用简洁专业的语言回答。
-    """
-    
-    try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "你是一个资深的金融交易分析师，擅长技术分析和加密货币市场。"},
-                {"role": "user", "content": prompt}
-            ],
-            stream=False
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"AI 分析请求失败: {str(e)}"
+# AI 分析函数（在后台任务线程中运行，不能调用 st.*）
+def analyze_market(api_key, base_url, model, messages, expires_at, job):
+    content, error, hit_writer = get_analysis(
+        api_key, base_url, model, messages, expires_at,
+        request=lambda: stream_analysis(api_key, base_url, model, messages, job.append, lambda: job.cancelled)
+    )
+    if not error:
+        # 相同请求的任务已合并，每个任务计一次
+        shared_cache.record("analysis", hit_writer == shared_cache.WARMER)
+    return content, error
+
+# 对话函数（在后台任务线程中运行）
+def answer_question(api_key, base_url, model, history, job):
+    return stream_analysis(api_key, base_url, model, history, job.append, lambda: job.cancelled)
+
+# 多模型对比（在后台任务线程中运行），每完成一个模型追加一行进度
+def compare_models(configs, messages, job):
+    def report(result, results):
+        status = "成功" if result["content"] else f"失败: {result['error']}"
+        job.append(f"- {result['label']}：{status}（{len(results)} / {len(configs)}）\n")
+
+    results = run_ensemble(
+        configs, messages, CRYPTO_DIRECTIONS, CRYPTO_LEVELS,
+        on_result=report, should_stop=lambda: job.cancelled
+    )
+    if job.cancelled:
+        return None, "已取消"
+    return results, None
+
+# 后台任务队列，所有会话共享一个有界线程池
+@st.cache_resource
+def get_job_queue():
+    return AnalysisJobQueue(max_workers=4, max_pending=32)
+
+job_queue = get_job_queue()
+
+def submit_job(slot, key, fn, inputs):
+    # key 含 API Key 的摘要：只合并同一个 Key 的相同请求，避免用别人的 Key 运行、消耗别人的 tokens
+    # 提交失败（队列已满）时显示提示并返回 False
+    job_ref = st.session_state[slot]
+    job, error = job_queue.submit(key, fn, st.session_state["session_id"])
+    if error:
+        st.warning(error)
+        return False
+    if job_ref and job_ref["id"] != job.id:
+        job_queue.release(job_ref["id"], st.session_state["session_id"])
+    st.session_state[slot] = {"id": job.id, "inputs": inputs}
+    return True
+
+def drop_unanswered_question():
+    # 回答未生成（取消或未能提交）时撤回最后一条提问，避免下次请求出现连续两条用户消息
+    messages = st.session_state["chat_messages"]
+    if messages and messages[-1]["role"] == "user":
+        messages.pop()
+
+def cancel_stale_jobs(inputs):
+    # 交易对、周期、数据或模型变化后，旧输入的任务已无意义，立即取消，避免继续消耗 tokens
+    for slot in ("analysis_job", "chat_job", "ensemble_job"):
+        job_ref = st.session_state[slot]
+        if job_ref and job_ref["inputs"] != inputs:
+            job_queue.release(job_ref["id"], st.session_state["session_id"])
+            st.session_state[slot] = None
+            if slot == "chat_job":
+                drop_unanswered_question()
+
+def cancel_job(slot):
+    job_queue.release(st.session_state[slot]["id"], st.session_state["session_id"])
+    st.session_state[slot] = None
+
+# 轮询后台任务状态，仅刷新此片段，任务结束后整页重新运行以展示结果
+@st.fragment(run_every=1)
+def show_analysis_job():
+    job_ref = st.session_state["analysis_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["analysis_job"] = None
+        if job is not None and job.status != CANCELLED:
+            st.session_state["analysis_result"] = job.result if job.status == DONE else f"AI 分析请求失败: {job.error}"
+            st.session_state["chat_messages"] = []
+        st.rerun()
+    if job.status == QUEUED:
+        st.info("分析任务排队中...")
+    else:
+        st.info(f"DeepSeek 正在思考中... 已接收 {job.progress} 字")
+        st.markdown(job.partial)
+    if st.button("取消分析"):
+        cancel_job("analysis_job")
+        st.rerun()
+
+@st.fragment(run_every=1)
+def show_chat_job():
+    job_ref = st.session_state["chat_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["chat_job"] = None
+        if job is not None and job.status != CANCELLED:
+            answer = job.result if job.status == DONE else f"对话请求失败: {job.error}"
+            st.session_state["chat_messages"].append({"role": "assistant", "content": answer})
+        else:
+            drop_unanswered_question()
+        st.rerun()
+    with st.chat_message("assistant"):
+        st.markdown(job.partial or "DeepSeek 正在回答...")
+
+@st.fragment(run_every=1)
+def show_ensemble_job():
+    job_ref = st.session_state["ensemble_job"]
+    job = job_queue.get(job_ref["id"]) if job_ref else None
+    if job is None or job.status in FINISHED:
+        st.session_state["ensemble_job"] = None
+        if job is not None and job.status in (DONE, FAILED):
+            # 与输入一起保存，切换标的或数据更新后不再展示旧的对比结果
+            st.session_state["ensemble_results"] = {"inputs": job_ref["inputs"], "results": job.result or [], "error": job.error}
+        st.rerun()
+    if job.status == QUEUED:
+        st.info("对比任务排队中...")
+    else:
+        st.info("正在并行请求各模型...")
+        st.markdown(job.partial)
+    if st.button("取消对比"):
+        cancel_job("ensemble_job")
+        st.rerun()
 
 # 主界面
 st.title("📈 AI 加密货币投资顾问 (DeepSeek Powered)")
@@ -233,24 +255,31 @@ if use_proxy:
         'https': https_proxy
     }
 
+expires_at = crypto_cache_expiry(timeframe).isoformat()
+
 with st.spinner("正在自动获取市场数据..."):
     if data_source == "Binance Futures":
-        df, error = fetch_binance_data(symbol, timeframe, days_back, proxies)
+        data, error = load_data(fetch_binance_data, symbol, timeframe, days_back, expires_at, proxies)
         if error and auto_switch:
-            df, cg_error = fetch_coingecko_data(symbol, timeframe, days_back, proxies)
-            if df is not None:
+            data, cg_error = load_data(fetch_coingecko_data, symbol, timeframe, days_back, expires_at, proxies)
+            if data is not None:
                 error = None
                 st.info("已自动切换到 CoinGecko 数据源。")
             else:
                 error = cg_error
     else:
-        df, error = fetch_coingecko_data(symbol, timeframe, days_back, proxies)
+        data, error = load_data(fetch_coingecko_data, symbol, timeframe, days_back, expires_at, proxies)
+
+analysis_inputs = (symbol, timeframe, days_back, data.fingerprint() if data is not None else None, base_url, model_name)
+cancel_stale_jobs(analysis_inputs)
 
 if error:
     st.error(f"数据获取失败: {error}")
 else:
+    df = data.to_frame()
+    
     # 2. 展示数据概览
-    st.success(f"已更新 {len(df)} 条 K 线数据")
+    st.success(f"已更新 {len(df)} 条 K 线数据（数据源: {describe_source(data.meta)}）")
     
     # 绘制 K 线图
     fig = go.Figure(data=[go.Candlestick(x=df['timestamp'],
@@ -270,7 +299,10 @@ else:
     
     # 展示最近数据表格
     with st.expander("查看详细数据"):
-        st.dataframe(df.sort_values('timestamp', ascending=False))
+        st.dataframe(
+            df.sort_values('timestamp', ascending=False),
+            column_config={name: st.column_config.NumberColumn(format=fmt) for name, fmt in float_formats(df).items()}
+        )
         
     # 3. AI 分析
     st.divider()
@@ -280,15 +312,69 @@ else:
         if not api_key:
             st.warning("⚠️ 请在侧边栏输入 DeepSeek API Key 以获取 AI 建议。")
         else:
-            with st.spinner("DeepSeek 正在思考中..."):
-                analysis_result = analyze_market(api_key, base_url, model_name, df, symbol)
-                st.session_state["analysis_result"] = analysis_result
-                st.session_state["chat_messages"] = []
+            messages = build_crypto_messages(df, symbol, timeframe)
+            submit_job(
+                "analysis_job",
+                ("analysis", credential_digest(api_key), analysis_digest(base_url, model_name, messages)),
+                lambda job: analyze_market(api_key, base_url, model_name, messages, expires_at, job),
+                analysis_inputs
+            )
+
+    if st.session_state["analysis_job"]:
+        show_analysis_job()
 
     # 显示分析结果 (如果存在)
     if st.session_state["analysis_result"]:
         st.markdown(st.session_state["analysis_result"])
 
+    # 多模型并行对比
+    with st.expander("🧪 多模型对比分析"):
+        ensemble_text = st.text_area(
+            "模型列表（每行一个）",
+            value=f"{model_name} | {base_url}",
+            help="格式：模型名称 | Base URL | 并发上限 | 超时(秒) | 输入单价 | 输出单价（单价为每百万 tokens，除模型名称外均可留空）。侧边栏的接口使用侧边栏的 Key，其他接口需在服务器端通过 ENSEMBLE_ENDPOINTS 配置"
+        )
+        variants_text = st.text_area("系统提示词变体（可选，每行一个）", value="")
+        if st.button("并行对比分析"):
+            variants = [v.strip() for v in variants_text.splitlines() if v.strip()]
+            configs, config_error = parse_model_configs(ensemble_text, api_key, base_url, variants, load_endpoint_keys())
+            if config_error:
+                st.warning(config_error)
+            elif not configs:
+                st.warning("请至少配置一个模型。")
+            else:
+                ensemble_messages = build_crypto_messages(df, symbol, timeframe)
+                submit_job(
+                    "ensemble_job",
+                    ("ensemble", credential_digest(api_key), ensemble_digest(configs, ensemble_messages)),
+                    lambda job: compare_models(configs, ensemble_messages, job),
+                    analysis_inputs
+                )
+
+        if st.session_state["ensemble_job"]:
+            show_ensemble_job()
+
+        ensemble = st.session_state["ensemble_results"]
+        if ensemble and ensemble["inputs"] == analysis_inputs:
+            if ensemble["error"]:
+                st.error(f"对比分析失败: {ensemble['error']}")
+            results = ensemble["results"]
+            consensus = build_consensus(results, CRYPTO_LEVELS)
+            col_dir, col_agree, col_cost, col_time = st.columns(4)
+            col_dir.metric("共识方向", consensus["direction"] or "无法判断")
+            col_agree.metric("一致率", f"{consensus['agreement']:.0%}")
+            col_cost.metric("总费用", f"{consensus['total_cost']:.4f}")
+            col_time.metric("墙钟耗时 / 串行耗时", f"{consensus['wall_time']:.1f}s / {consensus['sum_latency']:.1f}s")
+            if consensus["levels"]:
+                st.dataframe(pd.DataFrame(consensus["levels"]).T.rename(columns={
+                    "median": "中位数", "min": "最低", "max": "最高", "count": "模型数"
+                }))
+            st.dataframe(pd.DataFrame(results_table(results)))
+            for r in results:
+                with st.container(border=True):
+                    st.markdown(f"**{r['label']}** · {r['latency']:.1f}s")
+                    st.markdown(r["content"] or f"请求失败: {r['error']}")
+
     st.divider()
     st.subheader("💬 与 DeepSeek 对话")
     if not api_key:
@@ -305,43 +391,37 @@ else:
                 else:
                     with st.chat_message("assistant"):
                         st.markdown(msg["content"])
+            # 回答在后台任务中生成，这里轮询并流式显示
+            if st.session_state["chat_job"]:
+                show_chat_job()
             
-        user_question = st.chat_input("就当前市场分析继续提问...")
+        user_question = st.chat_input("就当前市场分析继续提问...", disabled=st.session_state["chat_job"] is not None)
         if user_question:
             st.session_state["chat_messages"].append({"role": "user", "content": user_question})
-            # 这里的 user 消息因为在 container 外面渲染，可能会有一瞬间不在滚动区域内
-            # 但下一帧重绘时会在 container 内显示。
-            # 为了更好的体验，我们直接在 container 内写一个临时显示逻辑不太容易，
-            # 依赖 Streamlit 的 rerun 机制是标准做法。
-            # 当用户输入后，st.chat_input 会触发 rerun，代码会从头执行。
-            # 执行到上面的 for msg in ... 时，新消息就会显示在 container 里了。
             
-            with st.spinner("DeepSeek 正在回答..."):
-                client = OpenAI(api_key=api_key, base_url=base_url)
-                history = [
-                    {
-                        "role": "system",
-                        "content": "你是一个资深的金融交易分析师，擅长技术分析和加密货币市场。回答要结合之前的分析结论，并保持逻辑一致。"
-                    },
-                    {
-                        "role": "user",
-                        "content": f"下面是你刚刚给出的关于 {symbol} 的市场分析结论：\n{st.session_state['analysis_result']}\n\n用户的追问会围绕这份分析展开，请据此回答。"
-                    }
-                ]
-                for m in st.session_state["chat_messages"]:
-                    history.append({"role": m["role"], "content": m["content"]})
-                try:
-                    response = client.chat.completions.create(
-                        model=model_name,
-                        messages=history,
-                        stream=False
-                    )
-                    answer = response.choices[0].message.content
-                except Exception as e:
-                    answer = f"对话请求失败: {str(e)}"
-                st.session_state["chat_messages"].append({"role": "assistant", "content": answer})
-                # 强制重新运行以显示最新消息
+            history = [
+                {
+                    "role": "system",
+                    "content": "你是一个资深的金融交易分析师，擅长技术分析和加密货币市场。回答要结合之前的分析结论，并保持逻辑一致。"
+                },
+                {
+                    "role": "user",
+                    "content": f"下面是你刚刚给出的关于 {symbol} 的市场分析结论：\n{st.session_state['analysis_result']}\n\n用户的追问会围绕这份分析展开，请据此回答。"
+                }
+            ]
+            for m in st.session_state["chat_messages"]:
+                history.append({"role": m["role"], "content": m["content"]})
+            
+            if submit_job(
+                "chat_job",
+                ("chat", credential_digest(api_key), analysis_digest(base_url, model_name, history)),
+                lambda job: answer_question(api_key, base_url, model_name, history, job),
+                analysis_inputs
+            ):
+                # 重新运行，使新消息显示在聊天容器内并开始轮询回答
                 st.rerun()
+            else:
+                drop_unanswered_question()
 
 # 页脚
 st.markdown("---")
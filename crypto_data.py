@@ -0,0 +1,125 @@
+import ccxt
+import requests
+
+import shared_cache
+from ingestion import parse_ccxt, parse_coingecko
+from market_calendar import crypto_fetch_since
+
+# 加密货币数据获取，不依赖 Streamlit，页面 (crypto_advisor.py) 与缓存预热进程 (cache_warmer.py) 共用
+
+
+def fetch_binance_frame(symbol, timeframe, days, proxies=None):
+    try:
+        config = {
+            'enableRateLimit': True,
+            'options': {
+                'defaultType': 'future',  # 永续合约
+            }
+        }
+        if proxies:
+            config['proxies'] = proxies
+            
+        exchange = ccxt.binance(config)
+        
+        # 强制只使用期货 API，避免访问 Spot API (api.binance.com)
+        # 必须保留 fapiPublic/fapiPrivate，否则 fetch_ohlcv 无法找到对应的 URL
+        exchange.urls['api'] = {
+            'public': 'https://fapi.binance.com/fapi/v1',
+            'private': 'https://fapi.binance.com/fapi/v1',
+            'fapiPublic': 'https://fapi.binance.com/fapi/v1',
+            'fapiPrivate': 'https://fapi.binance.com/fapi/v1',
+        }
+        
+        # 手动注入市场数据，欺骗 ccxt 认为市场已加载，从而跳过 exchangeInfo 请求
+        # 针对 Binance Futures，BTC/USDT 对应的 id 是 BTCUSDT
+        market_id = symbol.replace('/', '')
+        exchange.markets = {
+            symbol: {
+                'id': market_id,
+                'symbol': symbol,
+                'base': symbol.split('/')[0],
+                'quote': symbol.split('/')[1],
+                'active': True,
+                'type': 'future',
+                'spot': False,
+                'future': True,
+                'swap': True, 
+                'linear': True,
+                'inverse': False,  # USDT 合约通常是正向合约 (linear)，不是反向合约 (inverse)
+                'contract': True,
+                'option': False,
+                'margin': False,
+            }
+        }
+        exchange.markets_by_id = {
+            market_id: exchange.markets[symbol]
+        }
+        
+        # 计算起始时间（对齐到 K 线开盘时间）
+        since = crypto_fetch_since(timeframe, days)
+        
+        # 直接调用 fetch_ohlcv，此时 markets 已有数据，不会触发 load_markets
+        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since)
+        
+        if not ohlcv:
+            return None, "未获取到数据，请检查交易对名称是否正确。"
+            
+        return parse_ccxt(ohlcv, symbol, timeframe), None
+    except Exception as e:
+        return None, str(e)
+
+
+def fetch_coingecko_frame(symbol, timeframe, days, proxies=None):
+    try:
+        base, quote = symbol.split('/')
+        vs_map = {'USDT': 'usd', 'USD': 'usd', 'USDC': 'usd', 'CNY': 'cny', 'EUR': 'eur'}
+        vs_currency = vs_map.get(quote.upper(), 'usd')
+        mapping = {
+            'BTC': 'bitcoin', 'ETH': 'ethereum', 'BNB': 'binancecoin', 'SOL': 'solana',
+            'ADA': 'cardano', 'XRP': 'ripple', 'DOGE': 'dogecoin', 'TRX': 'tron',
+            'DOT': 'polkadot', 'AVAX': 'avalanche', 'LINK': 'chainlink', 'MATIC': 'polygon'
+        }
+        coin_id = mapping.get(base.upper())
+        if not coin_id:
+            r_list = requests.get(
+                'https://api.coingecko.com/api/v3/coins/list',
+                params={'include_platform': 'false'},
+                proxies=proxies,
+                timeout=8000
+            )
+            r_list.raise_for_status()
+            items = r_list.json()
+            coin_id = next((i['id'] for i in items if i.get('symbol', '').lower() == base.lower()), None)
+        if not coin_id:
+            return None, "无法解析交易对到 CoinGecko 资产。"
+        r = requests.get(
+            f'https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart',
+            params={'vs_currency': vs_currency, 'days': days},
+            proxies=proxies,
+            timeout=10000
+        )
+        r.raise_for_status()
+        data = r.json()
+        prices = data.get('prices', [])
+        volumes = data.get('total_volumes', [])
+        if not prices:
+            return None, "未获取到 CoinGecko 市场数据。"
+        # 按时间粒度聚合成 K 线
+        return parse_coingecko(prices, volumes, symbol, timeframe, vs_currency), None
+    except Exception as e:
+        return None, str(e)
+
+
+def get_binance_frame(symbol, timeframe, days, expires_at, proxies=None, writer=shared_cache.INTERACTIVE):
+    """先查共享缓存（可能已由预热进程写入），未命中再从币安获取。返回 (frame, error, hit_writer)。"""
+    return shared_cache.get_or_fetch(
+        "ohlcv", f"ohlcv:binance:{symbol}:{timeframe}:{days}:{expires_at}", expires_at,
+        lambda: fetch_binance_frame(symbol, timeframe, days, proxies), writer
+    )
+
+
+def get_coingecko_frame(symbol, timeframe, days, expires_at, proxies=None, writer=shared_cache.INTERACTIVE):
+    return shared_cache.get_or_fetch(
+        "ohlcv", f"ohlcv:coingecko:{symbol}:{timeframe}:{days}:{expires_at}", expires_at,
+        lambda: fetch_coingecko_frame(symbol, timeframe, days, proxies), writer
+    )
@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import statistics
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+from openai import AsyncOpenAI
+
+# 多模型并行对比分析：同一份行情数据同时发给多个模型 / 接口 / 提示词变体，
+# 每个接口单独限制并发，单个请求单独超时，结果按完成顺序返回，最后汇总成共识。
+
+# 各市场的操作方向，模型必须在结论行中原样给出其中之一
+CRYPTO_DIRECTIONS = ["做多", "做空", "观望"]
+ASHARE_DIRECTIONS = ["空仓观望", "买入", "卖出", "持仓"]
+
+# 各市场需要汇总的价位
+CRYPTO_LEVELS = ["入场位", "止损位", "止盈位", "支撑位", "阻力位"]
+ASHARE_LEVELS = ["参考价位", "止损位", "支撑位", "阻力位"]
+
+DEFAULT_MAX_CONCURRENCY = 2
+DEFAULT_TIMEOUT = 60.0
+
+
+def load_endpoint_keys():
+    """服务器端配置的其他接口及其 Key，来自环境变量 ENSEMBLE_ENDPOINTS（JSON）：
+
+    {"https://api.openai.com/v1": "OPENAI_API_KEY"}
+
+    值是保存 Key 的环境变量名。页面上只能选择这里列出的接口，不能指定读取哪个环境变量。
+    """
+    try:
+        mapping = json.loads(os.getenv("ENSEMBLE_ENDPOINTS") or "{}")
+    except ValueError:
+        return {}
+    if not isinstance(mapping, dict):
+        return {}
+    return {
+        url.rstrip("/"): os.getenv(env, "")
+        for url, env in mapping.items() if isinstance(url, str) and isinstance(env, str)
+    }
+
+
+def parse_model_configs(text, default_api_key, default_base_url, prompt_variants=None, endpoint_keys=None):
+    """解析多模型对比中的模型配置，每行一个：
+
+    模型名称 | Base URL | 并发上限 | 超时(秒) | 输入单价 | 输出单价
+
+    除模型名称外均可留空；单价为每百万 tokens 的价格。侧边栏的接口使用侧边栏的 Key，
+    其他接口必须在 endpoint_keys（见 load_endpoint_keys）中。若给出提示词变体，
+    每个模型会分别以每个变体运行一次。返回 (configs, error)。
+    """
+    endpoint_keys = endpoint_keys or {}
+    configs = []
+    for lineno, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = [f.strip() for f in line.split("|")]
+        fields += [""] * (6 - len(fields))
+        model, url, concurrency, timeout, in_price, out_price = fields[:6]
+        if not model:
+            continue
+        url = url or default_base_url
+        if url.rstrip("/") == default_base_url.rstrip("/"):
+            api_key = default_api_key
+        elif url.rstrip("/") in endpoint_keys:
+            api_key = endpoint_keys[url.rstrip("/")]
+        else:
+            return [], f"第 {lineno} 行：接口 {url} 未在服务器端配置 (ENSEMBLE_ENDPOINTS) 中，只能使用侧边栏的接口或已配置的接口。"
+        try:
+            max_concurrency = int(concurrency) if concurrency else DEFAULT_MAX_CONCURRENCY
+            timeout = float(timeout) if timeout else DEFAULT_TIMEOUT
+            input_price = float(in_price) if in_price else 0.0
+            output_price = float(out_price) if out_price else 0.0
+        except ValueError:
+            return [], f"第 {lineno} 行：并发上限应为整数，超时和单价应为数字。"
+        base = {
+            "label": f"{model}@{urlparse(url).netloc or url}",
+            "model": model,
+            "base_url": url,
+            "api_key": api_key,
+            "max_concurrency": max_concurrency,
+            "timeout": timeout,
+            "input_price": input_price,
+            "output_price": output_price,
+            "system_prompt": None,
+        }
+        if prompt_variants:
+            for i, variant in enumerate(prompt_variants, start=1):
+                configs.append(dict(base, label=f"{base['label']} #变体{i}", system_prompt=variant))
+        else:
+            configs.append(base)
+
+    # 同名配置加序号区分
+    seen = Counter()
+    for cfg in configs:
+        seen[cfg["label"]] += 1
+        if seen[cfg["label"]] > 1:
+            cfg["label"] = f"{cfg['label']} ({seen[cfg['label']]})"
+    return configs, None
+
+
+def summary_instruction(directions, level_labels):
+    fields = [f"方向: {'/'.join(directions)} 之一"] + [f"{label}: 数字或无" for label in level_labels]
+    return (
+        "\n\n请在回复的最后单独一行，严格按以下格式给出结论，不要添加其他文字或格式：\n"
+        + " | ".join(fields)
+    )
+
+
+def with_summary_request(messages, directions, level_labels):
+    """在最后一条用户消息后追加固定格式结论行的要求，共识只从这一行解析。"""
+    messages = [dict(m) for m in messages]
+    for m in reversed(messages):
+        if m["role"] == "user":
+            m["content"] += summary_instruction(directions, level_labels)
+            break
+    return messages
+
+
+def extract_summary(text, directions, level_labels):
+    """解析回复中最后一个 "方向: X | 价位: N | ..." 结论行，返回 (direction, levels)。
+
+    正文不参与解析；方向不在 directions 中或价位不是单个数字的字段忽略。
+    """
+    if not text:
+        return None, {}
+    for line in reversed(text.strip().splitlines()):
+        fields = {}
+        for part in line.replace("*", "").replace("`", "").split("|"):
+            m = re.match(r"\s*([^:：]+?)\s*[:：]\s*(.*?)\s*$", part)
+            if m:
+                fields[m.group(1)] = m.group(2)
+        if "方向" not in fields:
+            continue
+        direction = fields["方向"] if fields["方向"] in directions else None
+        levels = {}
+        for label in level_labels:
+            value = fields.get(label, "").replace(",", "")
+            if re.fullmatch(r"\d+(?:\.\d+)?", value):
+                levels[label] = float(value)
+        return direction, levels
+    return None, {}
+
+
+async def _run_one(cfg, messages, semaphore, clients, directions, level_labels):
+    result = {
+        "label": cfg["label"],
+        "model": cfg["model"],
+        "base_url": cfg["base_url"],
+        "content": None,
+        "error": None,
+        "wait": 0.0,
+        "latency": 0.0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cost": 0.0,
+        "direction": None,
+        "levels": {},
+    }
+    if not cfg["api_key"]:
+        result["error"] = "缺少 API Key"
+        return result
+
+    if cfg.get("system_prompt"):
+        messages = [{"role": "system", "content": cfg["system_prompt"]}] + [
+            m for m in messages if m["role"] != "system"
+        ]
+
+    client_key = (cfg["base_url"], cfg["api_key"])
+    if client_key not in clients:
+        clients[client_key] = AsyncOpenAI(api_key=cfg["api_key"], base_url=cfg["base_url"])
+    client = clients[client_key]
+
+    queued = time.perf_counter()
+    async with semaphore:
+        started = time.perf_counter()
+        result["wait"] = started - queued
+        try:
+            response = await asyncio.wait_for(
+                client.chat.completions.create(model=cfg["model"], messages=messages, stream=False),
+                timeout=cfg["timeout"],
+            )
+            result["content"] = response.choices[0].message.content
+            usage = getattr(response, "usage", None)
+            if usage:
+                result["prompt_tokens"] = usage.prompt_tokens or 0
+                result["completion_tokens"] = usage.completion_tokens or 0
+        except asyncio.TimeoutError:
+            result["error"] = f"请求超时 (>{cfg['timeout']:.0f}s)"
+        except Exception as e:
+            result["error"] = str(e)
+        result["latency"] = time.perf_counter() - started
+
+    result["cost"] = (
+        result["prompt_tokens"] * cfg["input_price"] + result["completion_tokens"] * cfg["output_price"]
+    ) / 1_000_000
+    result["direction"], result["levels"] = extract_summary(result["content"], directions, level_labels)
+    return result
+
+
+async def iter_ensemble(configs, messages, directions, level_labels):
+    """并行请求所有配置，按完成顺序逐个产出结果。"""
+    messages = with_summary_request(messages, directions, level_labels)
+    # 同一个接口共享一个信号量，上限取该接口第一次出现时的配置
+    semaphores = {}
+    for cfg in configs:
+        if cfg["base_url"] not in semaphores:
+            semaphores[cfg["base_url"]] = asyncio.Semaphore(max(1, cfg["max_concurrency"]))
+
+    clients = {}
+    tasks = [
+        asyncio.create_task(
+            _run_one(cfg, messages, semaphores[cfg["base_url"]], clients, directions, level_labels)
+        )
+        for cfg in configs
+    ]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()
+        for client in clients.values():
+            await client.close()
+
+
+def run_ensemble(configs, messages, directions, level_labels, on_result=None, should_stop=None):
+    """同步入口：每完成一个模型就回调 on_result(result, results)，返回已完成的结果。
+
+    should_stop() 为真时取消尚未完成的请求并立即返回（后台任务取消时使用）。
+    """
+    results = []
+
+    async def _collect():
+        async for result in iter_ensemble(configs, messages, directions, level_labels):
+            results.append(result)
+            if on_result:
+                on_result(result, results)
+
+    async def _main():
+        task = asyncio.create_task(_collect())
+        while not task.done():
+            if should_stop and should_stop():
+                # 取消会传入 iter_ensemble，由其 finally 取消其余请求并关闭连接
+                task.cancel()
+                break
+            await asyncio.wait({task}, timeout=0.5)
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    asyncio.run(_main())
+    return results
+
+
+def ensemble_digest(configs, messages):
+    """同一组模型配置（不含 Key）和同一份提示词的摘要，用于合并相同的对比任务。"""
+    fields = ("label", "model", "base_url", "system_prompt", "max_concurrency", "timeout", "input_price", "output_price")
+    payload = [[cfg[f] for f in fields] for cfg in configs]
+    return hashlib.sha1(json.dumps([payload, messages], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def build_consensus(results, level_labels):
+    ok = [r for r in results if r["content"]]
+    votes = Counter(r["direction"] for r in ok if r["direction"])
+    direction, count = votes.most_common(1)[0] if votes else (None, 0)
+
+    levels = {}
+    for label in level_labels:
+        values = [r["levels"][label] for r in ok if label in r["levels"]]
+        if values:
+            levels[label] = {
+                "median": statistics.median(values),
+                "min": min(values),
+                "max": max(values),
+                "count": len(values),
+            }
+
+    return {
+        "direction": direction,
+        "agreement": count / len(ok) if ok else 0.0,
+        "votes": dict(votes),
+        "levels": levels,
+        "succeeded": len(ok),
+        "failed": len(results) - len(ok),
+        "total_cost": sum(r["cost"] for r in results),
+        # 并行的墙钟耗时 vs 逐个串行调用的总耗时
+        "wall_time": max((r["wait"] + r["latency"] for r in results), default=0.0),
+        "sum_latency": sum(r["latency"] for r in results),
+    }
+
+
+def results_table(results):
+    rows = []
+    for r in results:
+        row = {
+            "模型": r["label"],
+            "方向": r["direction"] or "-",
+            "耗时(s)": round(r["latency"], 2),
+            "排队(s)": round(r["wait"], 2),
+            "输入 tokens": r["prompt_tokens"],
+            "输出 tokens": r["completion_tokens"],
+            "费用": round(r["cost"], 6),
+            "状态": "成功" if r["content"] else f"失败: {r['error']}",
+        }
+        row.update(r["levels"])
+        rows.append(row)
+    return rows
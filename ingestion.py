@@ -0,0 +1,185 @@
+import numpy as np
+import pandas as pd
+
+from market_calendar import TIMEFRAME_SECONDS
+from ohlcv_store import OHLCVFrame
+
+# 统一的数据接入层：每个数据源一个向量化解析函数，全部输出同一结构的 OHLCVFrame。
+#
+# 统一结构：
+#   timestamp  UTC int64 纳秒时间戳（K 线开盘时间；A 股日线为交易日北京时间零点）
+#   open/high/low/close/volume  float64（精度允许时由 OHLCVFrame 压缩为 float32）
+#   amount/pct_change/turnover  可选，数据源提供时才有
+# 行按时间严格递增，重复时间戳保留最后一条，OHLC 缺失的行被剔除。
+# meta 记录 source（数据源）、symbol、timeframe、adjust（复权方式）、tz（展示时区）、volume_unit（成交量单位）。
+
+REQUIRED_COLUMNS = ("open", "high", "low", "close", "volume")
+OPTIONAL_COLUMNS = ("amount", "pct_change", "turnover")
+
+ASHARE_TZ = "Asia/Shanghai"
+# A 股不实行夏令时，日期转 UTC 直接减去 8 小时
+ASHARE_UTC_OFFSET = np.timedelta64(8, "h")
+
+AKSHARE_COLUMNS = {
+    "日期": "timestamp",
+    "开盘": "open",
+    "最高": "high",
+    "最低": "low",
+    "收盘": "close",
+    "成交量": "volume",
+    "成交额": "amount",
+    "涨跌幅": "pct_change",
+    "换手率": "turnover",
+}
+
+BAOSTOCK_COLUMNS = {
+    "date": "timestamp",
+    "open": "open",
+    "high": "high",
+    "low": "low",
+    "close": "close",
+    "volume": "volume",
+    "amount": "amount",
+    "pctChg": "pct_change",
+    "turn": "turnover",
+}
+BAOSTOCK_FIELDS = ",".join(BAOSTOCK_COLUMNS)
+
+# akshare 的成交量单位是“手”，统一换算为股
+SHARES_PER_LOT = 100
+
+
+class IngestionError(ValueError):
+    pass
+
+
+def _to_float(values):
+    values = np.asarray(values)
+    if values.dtype.kind in "fiu":
+        return values.astype(np.float64, copy=False)
+    try:
+        # 字符串按 object 数组逐个 float()，比 numpy 定长字符串数组的转换快一个数量级
+        return values.astype(object, copy=False).astype(np.float64)
+    except (TypeError, ValueError):
+        # 含空字符串等无法直接转换的值（如 baostock 停牌日），逐个容错转换为 NaN
+        return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def _ashare_dates_to_utc(dates):
+    local = pd.to_datetime(np.asarray(dates)).to_numpy(dtype="datetime64[ns]")
+    return (local - ASHARE_UTC_OFFSET).view(np.int64)
+
+
+def normalize(timestamps, columns, meta):
+    """校验并整理为统一结构，返回 OHLCVFrame。timestamps 为 UTC int64 纳秒时间戳。"""
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise IngestionError(f"缺少字段: {', '.join(missing)}")
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    data = {
+        name: _to_float(columns[name])
+        for name in REQUIRED_COLUMNS + OPTIONAL_COLUMNS if name in columns
+    }
+    if any(len(values) != len(timestamps) for values in data.values()):
+        raise IngestionError("字段长度不一致")
+
+    valid = timestamps != np.iinfo(np.int64).min
+    for name in ("open", "high", "low", "close"):
+        valid &= np.isfinite(data[name])
+    index = np.flatnonzero(valid)
+    index = index[np.argsort(timestamps[index], kind="stable")]
+    ordered = timestamps[index]
+    # 相同时间戳保留最后一条（通常是数据源修正后的值）
+    keep = np.ones(len(ordered), dtype=bool)
+    keep[:-1] = ordered[1:] != ordered[:-1]
+    index = index[keep]
+
+    return OHLCVFrame.from_columns(
+        timestamps[index], {name: values[index] for name, values in data.items()}, meta
+    )
+
+
+def parse_ccxt(ohlcv, symbol, timeframe, source="binance-futures"):
+    """ccxt fetch_ohlcv 返回的 [[毫秒时间戳, 开, 高, 低, 收, 量], ...]。"""
+    rows = np.asarray(ohlcv, dtype=np.float64)
+    if rows.ndim != 2 or rows.shape[1] < 6:
+        raise IngestionError("ccxt K 线格式不正确")
+    timestamps = rows[:, 0].astype(np.int64) * 1_000_000
+    meta = {
+        "source": source, "symbol": symbol, "timeframe": timeframe,
+        "adjust": "none", "tz": "UTC", "volume_unit": "base",
+    }
+    return normalize(timestamps, dict(zip(REQUIRED_COLUMNS, rows[:, 1:6].T)), meta)
+
+
+def parse_coingecko(prices, volumes, symbol, timeframe, vs_currency):
+    """CoinGecko market_chart 的 [毫秒时间戳, 价格] / [毫秒时间戳, 成交量] 序列，按 timeframe 聚合成 K 线。"""
+    prices = np.asarray(prices, dtype=np.float64).reshape(-1, 2)
+    if not len(prices):
+        raise IngestionError("CoinGecko 价格序列为空")
+    prices = prices[np.argsort(prices[:, 0], kind="stable")]
+    ts_ms = prices[:, 0].astype(np.int64)
+    price = prices[:, 1]
+
+    # 成交量按时间戳对齐到价格序列，缺失记为 0
+    volume = np.zeros(len(price))
+    volumes = np.asarray(volumes, dtype=np.float64).reshape(-1, 2)
+    if len(volumes):
+        volumes = volumes[np.argsort(volumes[:, 0], kind="stable")]
+        vol_ms = volumes[:, 0].astype(np.int64)
+        pos = np.minimum(np.searchsorted(vol_ms, ts_ms), len(vol_ms) - 1)
+        matched = vol_ms[pos] == ts_ms
+        volume[matched] = np.nan_to_num(volumes[pos[matched], 1])
+
+    step_ms = TIMEFRAME_SECONDS.get(timeframe, 3600) * 1000
+    bucket = ts_ms // step_ms
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(bucket)] - 1
+    columns = {
+        "open": price[starts],
+        "high": np.maximum.reduceat(price, starts),
+        "low": np.minimum.reduceat(price, starts),
+        "close": price[ends],
+        "volume": np.add.reduceat(volume, starts),
+    }
+    meta = {
+        "source": "coingecko", "symbol": symbol, "timeframe": timeframe,
+        "adjust": "none", "tz": "UTC", "volume_unit": vs_currency,
+    }
+    return normalize(bucket[starts] * step_ms * 1_000_000, columns, meta)
+
+
+def parse_akshare(df, symbol, source, adjust):
+    """akshare 东方财富历史行情（中文列名，成交量单位为手）。"""
+    missing = [cn for cn in ("日期", "开盘", "最高", "最低", "收盘", "成交量") if cn not in df.columns]
+    if missing:
+        raise IngestionError(f"akshare 数据缺少字段: {', '.join(missing)}")
+    columns = {name: df[cn].to_numpy() for cn, name in AKSHARE_COLUMNS.items() if cn in df.columns and name != "timestamp"}
+    columns["volume"] = _to_float(columns["volume"]) * SHARES_PER_LOT
+    meta = {
+        "source": source, "symbol": symbol, "timeframe": "1d",
+        "adjust": adjust, "tz": ASHARE_TZ, "volume_unit": "shares",
+    }
+    return normalize(_ashare_dates_to_utc(df["日期"]), columns, meta)
+
+
+def parse_baostock(rows, fields, symbol, adjust):
+    """baostock query_history_k_data_plus 的行数据（全部为字符串）。"""
+    rows = np.array(rows, dtype=object).reshape(-1, len(fields))
+    position = {field: i for i, field in enumerate(fields)}
+    if "date" not in position:
+        raise IngestionError("baostock 数据缺少字段: date")
+    columns = {
+        name: rows[:, position[field]]
+        for field, name in BAOSTOCK_COLUMNS.items() if field in position and name != "timestamp"
+    }
+    meta = {
+        "source": "baostock", "symbol": symbol, "timeframe": "1d",
+        "adjust": adjust, "tz": ASHARE_TZ, "volume_unit": "shares",
+    }
+    return normalize(_ashare_dates_to_utc(rows[:, position["date"]]), columns, meta)
+
+
+def describe_source(meta):
+    adjust = {"qfq": "前复权", "hfq": "后复权"}.get(meta.get("adjust"), "")
+    return f"{meta.get('source', '未知')}{' · ' + adjust if adjust else ''}"
@@ -0,0 +1,129 @@
+import hashlib
+import json
+
+from openai import OpenAI
+
+import shared_cache
+from ohlcv_store import format_ohlcv
+
+# AI 分析的提示词与请求，页面与缓存预热进程 (cache_warmer.py) 共用
+
+
+def build_ashare_messages(df, symbol_name, symbol_code):
+    # 准备数据摘要
+    recent_data = format_ohlcv(df)
+    current_price = df['close'].iloc[-1]
+    
+    prompt = f"""
+    你是专业的 A 股证券分析师。请根据以下 {symbol_name} ({symbol_code}) 的近期市场数据（日线）进行分析。
+    当前价格: {current_price}
+    
+    近期数据 (OHLCV):
+    {recent_data}
+    
+    请完成以下任务：
+    1. 分析当前的市场趋势（上涨、下跌或震荡）。
+    2. 识别关键的支撑位和阻力位。
+    3. 结合成交量变化分析主力资金动向和市场情绪。
+    4. 给出明确的操作建议：【买入 / 卖出 / 持仓 / 空仓观望】。
+    5. 如果建议操作，请给出具体的【参考价位】和【止损位】。
+    
+    请注意 A 股市场特点（T+1 交易，涨跌幅限制等），用简洁专业的语言回答。
+    """
+    
+    return [
+        {"role": "system", "content": "你是一个资深的 A 股证券分析师，擅长技术分析和基本面判断。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def build_crypto_messages(df, symbol, timeframe):
+    # 准备数据摘要，避免 token 过多
+    # 取最近的 N 条数据
+    recent_data = format_ohlcv(df.tail(24))
+    
+    current_price = df['close'].iloc[-1]
+    
+    prompt = f"""
+    你是专业的加密货币交易分析师。请根据以下 {symbol} 的近期市场数据（时间周期：{timeframe}）进行分析。
+    当前价格: {current_price}
+    
+    近期数据 (OHLCV):
+    {recent_data}
+    
+    请完成以下任务：
+    1. 分析当前的市场趋势（上涨、下跌或震荡）。
+    2. 识别关键的支撑位和阻力位。
+    3. 结合成交量变化分析市场情绪。
+    4. 给出明确的操作建议：【做多 / 做空 / 观望】。
+    5. 如果建议操作，请给出具体的【入场位】、【止损位】和【止盈位】。
+    
+    请用简洁专业的语言回答。
+    """
+    
+    return [
+        {"role": "system", "content": "你是一个资深的金融交易分析师，擅长技术分析和加密货币市场。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def request_analysis(api_key, base_url, model, messages):
+    """返回 (分析内容, 错误信息)。"""
+    client = OpenAI(api_key=api_key, base_url=base_url)
+    
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=False
+        )
+        return response.choices[0].message.content, None
+    except Exception as e:
+        return None, str(e)
+
+
+def stream_analysis(api_key, base_url, model, messages, on_delta=None, should_stop=None):
+    """流式请求，逐块回调 on_delta；should_stop() 为真时关闭连接中止生成。返回 (分析内容, 错误信息)。"""
+    client = OpenAI(api_key=api_key, base_url=base_url)
+    
+    try:
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True
+        )
+        parts = []
+        for chunk in stream:
+            if should_stop and should_stop():
+                stream.close()
+                return None, "已取消"
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                parts.append(delta)
+                if on_delta:
+                    on_delta(delta)
+        return "".join(parts), None
+    except Exception as e:
+        return None, str(e)
+
+
+def credential_digest(api_key):
+    # 只用于区分不同的 Key（如后台任务合并），不保存 Key 本身
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def analysis_digest(base_url, model, messages):
+    return hashlib.sha1(
+        json.dumps([base_url, model, messages], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def get_analysis(api_key, base_url, model, messages, expires_at, writer=shared_cache.INTERACTIVE, request=None):
+    """同一模型、同一份提示词（含行情数据）的分析结果在数据失效前共享，返回 (content, error, hit_writer)。
+
+    request 可替换实际的请求函数（如后台任务中的流式请求），默认使用 request_analysis。
+    """
+    request = request or (lambda: request_analysis(api_key, base_url, model, messages))
+    return shared_cache.get_or_fetch(
+        "analysis", f"analysis:{analysis_digest(base_url, model, messages)}", expires_at, request, writer
+    )
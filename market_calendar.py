@@ -0,0 +1,183 @@
+import bisect
+import datetime
+import time
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+# 交易日历：A 股（上交所/深交所）按交易日和交易时段计算，加密货币 7x24 按 K 线周期计算。
+# 用于精确计算 N 根 K 线的获取区间，以及缓存何时真正需要失效（出现新 K 线的时刻）。
+
+CST = ZoneInfo("Asia/Shanghai")
+
+ASHARE_OPEN = datetime.time(9, 30)
+ASHARE_LUNCH_START = datetime.time(11, 30)
+ASHARE_LUNCH_END = datetime.time(13, 0)
+ASHARE_CLOSE = datetime.time(15, 0)
+# 收盘后数据源仍会修正当日 K 线，这段时间内继续按盘中频率刷新
+ASHARE_SETTLE = datetime.timedelta(minutes=30)
+# 盘中当日 K 线（以及加密货币未收盘的 K 线）实时变化，按固定间隔刷新
+INTRADAY_REFRESH = 300
+
+CALENDAR_REFRESH = 24 * 3600
+CALENDAR_RETRY = 3600
+
+TIMEFRAME_SECONDS = {'1m': 60, '5m': 300, '15m': 900, '30m': 1800, '1h': 3600, '4h': 14400, '1d': 86400}
+
+_calendar = {"dates": None, "loaded_at": 0.0}
+
+
+def _load_trade_dates():
+    # 仅 A 股需要 akshare，延迟导入避免加密货币页面加载它
+    try:
+        import akshare as ak
+        df = ak.tool_trade_date_hist_sina()
+        return sorted(pd.to_datetime(df["trade_date"]).dt.date)
+    except Exception:
+        return None
+
+
+def ashare_trade_dates():
+    """返回已排序的 A 股交易日列表；获取失败时返回 None，调用方按工作日近似。"""
+    age = time.time() - _calendar["loaded_at"]
+    expired = age > (CALENDAR_REFRESH if _calendar["dates"] else CALENDAR_RETRY)
+    if expired:
+        dates = _load_trade_dates()
+        if dates or _calendar["dates"] is None:
+            _calendar["dates"] = dates
+        _calendar["loaded_at"] = time.time()
+    return _calendar["dates"]
+
+
+def _covered(dates, d):
+    # 交易日历只覆盖到当年年底，超出部分按工作日近似
+    return dates is not None and dates[0] <= d <= dates[-1]
+
+
+def is_trade_date(d):
+    dates = ashare_trade_dates()
+    if _covered(dates, d):
+        i = bisect.bisect_left(dates, d)
+        return i < len(dates) and dates[i] == d
+    return d.weekday() < 5
+
+
+def next_trade_date(d):
+    """严格晚于 d 的下一个交易日。"""
+    dates = ashare_trade_dates()
+    if _covered(dates, d):
+        i = bisect.bisect_right(dates, d)
+        if i < len(dates):
+            return dates[i]
+        d = dates[-1]
+    d += datetime.timedelta(days=1)
+    while d.weekday() >= 5:
+        d += datetime.timedelta(days=1)
+    return d
+
+
+def previous_trade_dates(end, n):
+    """不晚于 end 的最近 n 个交易日，按时间升序。"""
+    dates = ashare_trade_dates()
+    result = []
+    d = end
+    while len(result) < n:
+        if _covered(dates, d):
+            i = bisect.bisect_right(dates, d)
+            take = dates[max(i - (n - len(result)), 0):i]
+            result = take + result
+            if i - len(take) == 0:
+                break
+            d = take[0] - datetime.timedelta(days=1)
+        else:
+            if d.weekday() < 5:
+                result.insert(0, d)
+            d -= datetime.timedelta(days=1)
+    return result
+
+
+def _now_cst(now):
+    if now is None:
+        return datetime.datetime.now(CST)
+    if now.tzinfo is None:
+        return now.replace(tzinfo=CST)
+    return now.astimezone(CST)
+
+
+def _at(d, t):
+    return datetime.datetime.combine(d, t, tzinfo=CST)
+
+
+def ashare_last_bar_date(now=None):
+    """当前时刻能取到的最新日 K 线所在交易日（开盘后才有当日 K 线）。"""
+    now = _now_cst(now)
+    today = now.date()
+    if is_trade_date(today) and now.time() >= ASHARE_OPEN:
+        return today
+    return previous_trade_dates(today - datetime.timedelta(days=1), 1)[0]
+
+
+def ashare_fetch_range(days, now=None):
+    """最近 days 个交易日对应的 (起始日期, 结束日期)。"""
+    end = ashare_last_bar_date(now)
+    return previous_trade_dates(end, days)[0], end
+
+
+def ashare_next_open(now=None):
+    """下一次 A 股开盘时刻（当日未开盘则为当日 09:30）。"""
+    now = _now_cst(now)
+    today = now.date()
+    if is_trade_date(today) and now.time() < ASHARE_OPEN:
+        return _at(today, ASHARE_OPEN)
+    return _at(next_trade_date(today), ASHARE_OPEN)
+
+
+def ashare_index_date(now=None):
+    """证券列表对应的交易日：收盘修正时段结束后切换到下一交易日，避免与开盘时刻的行情缓存同时失效。"""
+    now = _now_cst(now)
+    today = now.date()
+    if is_trade_date(today) and now < _at(today, ASHARE_CLOSE) + ASHARE_SETTLE:
+        return today
+    return next_trade_date(today)
+
+
+def ashare_index_expiry(index_date):
+    return _at(index_date, ASHARE_CLOSE) + ASHARE_SETTLE
+
+
+def ashare_cache_expiry(now=None):
+    """A 股日线缓存的失效时刻：盘中按固定间隔，午休到下午开盘，收盘后到下一交易日开盘。"""
+    now = _now_cst(now)
+    today = now.date()
+    if is_trade_date(today):
+        t = now.time()
+        settle = (_at(today, ASHARE_CLOSE) + ASHARE_SETTLE).time()
+        if ASHARE_LUNCH_START <= t < ASHARE_LUNCH_END:
+            return _at(today, ASHARE_LUNCH_END)
+        if ASHARE_OPEN <= t < settle:
+            seconds = now.hour * 3600 + now.minute * 60 + now.second
+            bucket_end = (seconds // INTRADAY_REFRESH + 1) * INTRADAY_REFRESH
+            return _at(today, datetime.time()) + datetime.timedelta(seconds=bucket_end)
+    return ashare_next_open(now)
+
+
+def _candle_open(timeframe, now):
+    step = TIMEFRAME_SECONDS[timeframe]
+    ts = int(now.timestamp())
+    return ts - ts % step
+
+
+def crypto_fetch_since(timeframe, days, now=None):
+    """从当前 K 线开盘时间往前推 days 天，使返回的 K 线数量固定（毫秒时间戳）。"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return (_candle_open(timeframe, now) - days * 86400) * 1000
+
+
+def crypto_cache_expiry(timeframe, now=None):
+    """加密货币缓存的失效时刻（7x24，无休市）：未收盘的 K 线实时变化，与 A 股盘中一样按固定间隔刷新，
+    当前 K 线收盘早于下一个刷新时刻时以收盘为准。"""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    ts = int(now.timestamp())
+    close = _candle_open(timeframe, now) + TIMEFRAME_SECONDS[timeframe]
+    refresh = ts - ts % INTRADAY_REFRESH + INTRADAY_REFRESH
+    return datetime.datetime.fromtimestamp(min(close, refresh), datetime.timezone.utc)
@@ -0,0 +1,127 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+# 缓存用的紧凑 OHLCV 结构：按列存放只读 NumPy 数组，价格在精度允许时压缩为 float32，
+# 时间戳统一为 UTC 的 int64 纳秒时间戳，meta 中记录来源、复权方式、展示时区等元数据。配合 st.cache_resource 使用时所有会话共享同一份数据，
+# to_frame() 只构造引用这些数组的只读 DataFrame 视图，不再像 st.cache_data 那样每次反序列化一份副本。
+
+MAX_DECIMALS = 8
+
+
+def _infer_decimals(values):
+    # 找出能无损表示这一列的最少小数位数，超过 MAX_DECIMALS 视为任意精度
+    finite = values[np.isfinite(values)]
+    for d in range(MAX_DECIMALS + 1):
+        if np.allclose(np.round(finite, d), finite, rtol=1e-12, atol=1e-12):
+            return d
+    return None
+
+
+def _compact_float(values):
+    values = np.asarray(values, dtype=np.float64)
+    decimals = _infer_decimals(values)
+    if decimals is not None:
+        narrowed = values.astype(np.float32)
+        # float32 还原后按原小数位取整仍与原值一致，才使用 float32
+        restored = np.round(narrowed.astype(np.float64), decimals)
+        if np.allclose(restored, values, rtol=1e-12, atol=1e-12, equal_nan=True):
+            values = narrowed
+    return values, decimals
+
+
+def _readonly(values):
+    values = np.ascontiguousarray(values)
+    values.setflags(write=False)
+    return values
+
+
+class OHLCVFrame:
+    __slots__ = ("columns", "decimals", "length", "meta", "_local")
+
+    def __init__(self, columns, decimals, meta=None, local=None):
+        self.columns = columns
+        self.decimals = decimals
+        self.meta = meta or {}
+        # 按展示时区转换后的时间戳列，首次 to_frame 时计算一次，之后所有会话共用
+        self._local = local or {}
+        self.length = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_columns(cls, timestamps, data, meta=None, time_column="timestamp"):
+        """由已校验的列构造：timestamps 为 UTC int64 纳秒时间戳，data 为 {列名: float64 数组}。"""
+        columns = {time_column: _readonly(np.asarray(timestamps, dtype=np.int64))}
+        decimals = {}
+        for name, values in data.items():
+            values, d = _compact_float(values)
+            columns[name] = _readonly(values)
+            if d is not None:
+                decimals[name] = d
+        return cls(columns, decimals, meta)
+
+    def __getstate__(self):
+        return self.columns, self.decimals, self.meta
+
+    def __setstate__(self, state):
+        # 反序列化（如从共享缓存读取）后的数组默认可写，这里重新设为只读
+        columns, decimals, *rest = state
+        self.__init__({name: _readonly(values) for name, values in columns.items()}, decimals, *rest)
+
+    def __len__(self):
+        return self.length
+
+    def fingerprint(self):
+        """数据内容的摘要，用于判断分析任务的输入是否已变化。"""
+        digest = hashlib.sha1()
+        for name, values in self.columns.items():
+            digest.update(name.encode("utf-8"))
+            digest.update(values.tobytes() if values.dtype != object else repr(values.tolist()).encode("utf-8"))
+        return digest.hexdigest()
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self.columns.values()) + sum(v.nbytes for v in self._local.values())
+
+    def tail(self, n):
+        """最近 n 行，与原数据共享内存。"""
+        start = max(self.length - n, 0)
+        return OHLCVFrame(
+            {name: values[start:] for name, values in self.columns.items()}, self.decimals, self.meta,
+            {name: values[start:] for name, values in self._local.items()},
+        )
+
+    def local_times(self, time_column="timestamp"):
+        """按 meta 中的 tz 展示的当地时间（如 A 股日期），只读，与共享缓存中的其他列一样不随会话复制。"""
+        values = self.columns[time_column].view("datetime64[ns]")
+        tz = self.meta.get("tz", "UTC")
+        if tz == "UTC":
+            return values
+        local = self._local.get(time_column)
+        if local is None:
+            local = pd.DatetimeIndex(values).tz_localize("UTC").tz_convert(tz).tz_localize(None).to_numpy()
+            local = self._local[time_column] = _readonly(local)
+        return local
+
+    def to_frame(self, tail=None, time_column="timestamp"):
+        # 只切片不复制；数组只读，调用方原地修改会直接报错而不会污染共享缓存
+        start = max(self.length - tail, 0) if tail else 0
+        data = {
+            name: (self.local_times(time_column) if name == time_column else values)[start:]
+            for name, values in self.columns.items()
+        }
+        df = pd.DataFrame(data, copy=False)
+        df.attrs["decimals"] = dict(self.decimals)
+        df.attrs["meta"] = dict(self.meta)
+        return df
+
+
+def float_formats(df):
+    # float32 直接打印会出现 67234.562500 这样的尾数，按原始小数位格式化
+    decimals = df.attrs.get("decimals", {})
+    return {name: f"%.{d}f" for name, d in decimals.items() if name in df.columns}
+
+
+def format_ohlcv(df):
+    formatters = {name: (lambda v, f=fmt: f % v) for name, fmt in float_formats(df).items()}
+    return df.to_string(index=False, formatters=formatters)
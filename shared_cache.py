@@ -0,0 +1,131 @@
+import contextlib
+import datetime
+import os
+import pickle
+import sqlite3
+import time
+
+# 跨进程共享缓存（SQLite）：页面进程与缓存预热进程 (cache_warmer.py) 共用。
+# 每个条目带失效时间并记录写入方（预热进程 / 页面）。页面按请求调用 record 统计预热命中率：
+# 数据来自预热进程写入的条目记为 warm，其余（现场获取、命中页面自己写入的条目）记为 cold。
+# 缓存不可用（如只读文件系统）时所有操作静默降级为未命中，不影响页面正常获取数据。
+
+DB_PATH = os.getenv(
+    "INVEST_ADVISOR_CACHE_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "shared_cache.sqlite3")
+)
+
+WARMER = "warmer"
+INTERACTIVE = "interactive"
+
+_initialized = set()
+
+
+@contextlib.contextmanager
+def _connect():
+    if DB_PATH not in _initialized:
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        if DB_PATH not in _initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, kind TEXT, value BLOB, expires_at REAL, created_at REAL, writer TEXT)"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "writer" not in columns:
+                # 旧版本创建的缓存库没有写入方，视为页面写入
+                conn.execute(f"ALTER TABLE entries ADD COLUMN writer TEXT DEFAULT '{INTERACTIVE}'")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "kind TEXT PRIMARY KEY, warm INTEGER DEFAULT 0, cold INTEGER DEFAULT 0)"
+            )
+            _initialized.add(DB_PATH)
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _timestamp(expires_at):
+    if isinstance(expires_at, str):
+        expires_at = datetime.datetime.fromisoformat(expires_at)
+    if isinstance(expires_at, datetime.datetime):
+        return expires_at.timestamp()
+    return float(expires_at)
+
+
+def get(key):
+    """返回 (value, writer)，未命中为 (None, None)。"""
+    try:
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT value, writer FROM entries WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return (pickle.loads(row[0]), row[1]) if row else (None, None)
+    except Exception:
+        return None, None
+
+
+def put(key, kind, value, expires_at, writer=INTERACTIVE):
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, expires_at, created_at, writer) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, pickle.dumps(value), _timestamp(expires_at), time.time(), writer)
+            )
+    except Exception:
+        pass
+
+
+def record(kind, warm):
+    try:
+        column = "warm" if warm else "cold"
+        with _connect() as conn:
+            conn.execute("INSERT OR IGNORE INTO stats (kind) VALUES (?)", (kind,))
+            conn.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE kind = ?", (kind,))
+    except Exception:
+        pass
+
+
+def get_or_fetch(kind, key, expires_at, fetch, writer=INTERACTIVE):
+    """先查共享缓存，未命中再调用 fetch() -> (value, error)，成功的结果以 writer 的名义写回缓存。
+
+    返回 (value, error, hit_writer)：命中时 hit_writer 为该条目的写入方，现场获取时为 None。
+    """
+    value, hit_writer = get(key)
+    if value is not None:
+        return value, None, hit_writer
+    value, error = fetch()
+    if error is None and value is not None:
+        put(key, kind, value, expires_at, writer)
+    return value, error, None
+
+
+def stats():
+    try:
+        with _connect() as conn:
+            rows = conn.execute("SELECT kind, warm, cold FROM stats ORDER BY kind").fetchall()
+    except Exception:
+        return {}
+    return {
+        kind: {"warm": warm, "cold": cold, "ratio": warm / (warm + cold) if warm + cold else 0.0}
+        for kind, warm, cold in rows
+    }
+
+
+def reset_stats():
+    try:
+        with _connect() as conn:
+            conn.execute("DELETE FROM stats")
+    except Exception:
+        pass
+
+
+def purge_expired():
+    try:
+        with _connect() as conn:
+            return conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),)).rowcount
+    except Exception:
+        return 0
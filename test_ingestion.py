@@ -0,0 +1,102 @@
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ingestion import BAOSTOCK_COLUMNS, IngestionError, parse_akshare, parse_baostock, parse_ccxt, parse_coingecko
+
+# 离线测试：各数据源解析后的统一结构、去重排序、单位换算，以及 OHLCVFrame 的只读视图。
+# 用法：python -m pytest -q test_ingestion.py
+
+HOUR_MS = 3_600_000
+T0 = 1_700_000_000_000 - 1_700_000_000_000 % HOUR_MS
+
+
+def ms(values):
+    return [pd.Timestamp(v, unit="ms") for v in values]
+
+
+def test_ccxt_sorts_and_keeps_last_duplicate():
+    frame = parse_ccxt([
+        [T0 + HOUR_MS, 2, 2, 2, 2, 20],
+        [T0, 1, 1, 1, 1, 10],
+        [T0 + HOUR_MS, 3, 3, 3, 3, 30],
+    ], "BTC/USDT", "1h")
+    df = frame.to_frame()
+    assert df["timestamp"].tolist() == ms([T0, T0 + HOUR_MS])
+    assert df["close"].tolist() == [1, 3]
+    assert df["volume"].tolist() == [10, 30]
+
+
+def test_ccxt_drops_rows_with_missing_ohlc():
+    frame = parse_ccxt([
+        [T0, 1, 1, 1, 1, 10],
+        [T0 + HOUR_MS, 2, np.nan, 2, 2, 20],
+    ], "BTC/USDT", "1h")
+    assert len(frame) == 1
+
+
+def test_ccxt_rejects_malformed_rows():
+    with pytest.raises(IngestionError):
+        parse_ccxt([[T0, 1, 1, 1]], "BTC/USDT", "1h")
+
+
+def test_coingecko_buckets_into_candles():
+    prices = [[T0 + 60_000, 12], [T0, 10], [T0 + 120_000, 9], [T0 + HOUR_MS, 20]]
+    volumes = [[T0, 1], [T0 + 60_000, 2], [T0 + HOUR_MS, 5]]
+    df = parse_coingecko(prices, volumes, "BTC/USDT", "1h", "usd").to_frame()
+    assert df["timestamp"].tolist() == ms([T0, T0 + HOUR_MS])
+    assert df[["open", "high", "low", "close"]].values.tolist() == [[10, 12, 9, 9], [20, 20, 20, 20]]
+    # 没有对应成交量的价格点按 0 计
+    assert df["volume"].tolist() == [3, 5]
+
+
+def test_akshare_converts_lots_to_shares():
+    df = pd.DataFrame({
+        "日期": ["2024-10-08", "2024-09-30"], "开盘": [10.0, 9.0], "最高": [11.0, 9.5],
+        "最低": [9.5, 8.5], "收盘": [10.5, 9.2], "成交量": [1200, 800],
+    })
+    frame = parse_akshare(df, "600519", "akshare.stock_zh_a_hist", "qfq")
+    assert frame.meta["volume_unit"] == "shares"
+    assert frame.to_frame()["volume"].tolist() == [80_000, 120_000]
+
+
+def test_akshare_reports_missing_columns():
+    with pytest.raises(IngestionError, match="成交量"):
+        parse_akshare(pd.DataFrame({"日期": [], "开盘": [], "最高": [], "最低": [], "收盘": []}), "600519", "akshare", "qfq")
+
+
+def test_baostock_empty_strings():
+    fields = list(BAOSTOCK_COLUMNS)
+    rows = [
+        ["2024-09-27", "10.00", "10.50", "9.80", "10.20", "1000", "10200.00", "1.5", "0.3"],
+        # 停牌日 baostock 返回空字符串
+        ["2024-09-30", "", "", "", "", "", "", "", ""],
+        ["2024-10-08", "10.30", "10.60", "10.10", "10.40", "1500", "15600.00", "2.0", ""],
+    ]
+    df = parse_baostock(rows, fields, "sh.600519", "qfq").to_frame()
+    assert df["close"].tolist() == pytest.approx([10.2, 10.4])
+    assert df["turnover"].iloc[0] == pytest.approx(0.3)
+    assert np.isnan(df["turnover"].iloc[1])
+
+
+def test_ashare_dates_stored_as_utc_and_shown_local():
+    rows = [["2024-10-08", "10", "11", "9", "10", "100", "1000", "0", "0"]]
+    frame = parse_baostock(rows, list(BAOSTOCK_COLUMNS), "sh.600519", "qfq")
+    assert frame.columns["timestamp"][0] == pd.Timestamp("2024-10-07 16:00", tz="UTC").value
+    assert frame.to_frame()["timestamp"].tolist() == [pd.Timestamp("2024-10-08")]
+
+
+def test_frame_is_read_only_and_shares_memory():
+    frame = parse_ccxt([[T0 + i * HOUR_MS, 1.5, 2, 1, 1.5, 10] for i in range(5)], "BTC/USDT", "1h")
+    df = frame.to_frame(tail=2)
+    assert len(df) == 2
+    assert np.shares_memory(df["close"].to_numpy(), frame.columns["close"])
+    with pytest.raises(ValueError):
+        frame.columns["close"][0] = 0
+    # 价格可无损表示时压缩为 float32，反序列化后仍为只读
+    assert frame.columns["close"].dtype == np.float32
+    restored = pickle.loads(pickle.dumps(frame))
+    assert not restored.columns["close"].flags.writeable
+    assert restored.fingerprint() == frame.fingerprint()
@@ -0,0 +1,113 @@
+import datetime
+import time
+
+import pandas as pd
+import pytest
+
+import market_calendar
+from market_calendar import CST
+
+# 离线测试：用固定的交易日历替换 akshare 数据，覆盖节假日、日历边界、午休与收盘修正时段、K 线对齐。
+# 用法：python -m pytest -q test_market_calendar.py
+
+D = datetime.date
+UTC = datetime.timezone.utc
+
+# 2024 年 9、10 月：中秋 9/16-9/17、国庆 10/1-10/7 休市；日历只覆盖到 10/31，之后按工作日近似
+HOLIDAYS = {D(2024, 9, 16), D(2024, 9, 17)} | {D(2024, 10, d) for d in range(1, 8)}
+TRADE_DATES = [d.date() for d in pd.bdate_range("2024-09-02", "2024-10-31") if d.date() not in HOLIDAYS]
+
+
+@pytest.fixture(autouse=True)
+def calendar(monkeypatch):
+    monkeypatch.setattr(market_calendar, "_load_trade_dates", lambda: list(TRADE_DATES))
+    monkeypatch.setitem(market_calendar._calendar, "dates", list(TRADE_DATES))
+    monkeypatch.setitem(market_calendar._calendar, "loaded_at", time.time())
+
+
+def cst(*args):
+    return datetime.datetime(*args, tzinfo=CST)
+
+
+def utc(*args):
+    return datetime.datetime(*args, tzinfo=UTC)
+
+
+def test_holidays_are_not_trade_dates():
+    assert not market_calendar.is_trade_date(D(2024, 10, 1))
+    assert not market_calendar.is_trade_date(D(2024, 9, 16))
+    assert market_calendar.is_trade_date(D(2024, 10, 8))
+
+
+def test_previous_trade_dates_skip_holidays():
+    assert market_calendar.previous_trade_dates(D(2024, 10, 8), 3) == [D(2024, 9, 27), D(2024, 9, 30), D(2024, 10, 8)]
+    assert market_calendar.previous_trade_dates(D(2024, 10, 5), 2) == [D(2024, 9, 27), D(2024, 9, 30)]
+    assert market_calendar.previous_trade_dates(D(2024, 9, 18), 2) == [D(2024, 9, 13), D(2024, 9, 18)]
+
+
+def test_previous_trade_dates_across_calendar_edge():
+    # 11 月不在日历内按工作日取，10/31 及之前回到日历
+    assert market_calendar.previous_trade_dates(D(2024, 11, 5), 4) == [
+        D(2024, 10, 31), D(2024, 11, 1), D(2024, 11, 4), D(2024, 11, 5),
+    ]
+
+
+def test_next_trade_date():
+    assert market_calendar.next_trade_date(D(2024, 9, 30)) == D(2024, 10, 8)
+    assert market_calendar.next_trade_date(D(2024, 10, 31)) == D(2024, 11, 1)
+    assert market_calendar.next_trade_date(D(2024, 11, 1)) == D(2024, 11, 4)
+
+
+def test_weekday_fallback_without_calendar(monkeypatch):
+    monkeypatch.setattr(market_calendar, "_load_trade_dates", lambda: None)
+    monkeypatch.setitem(market_calendar._calendar, "dates", None)
+    assert market_calendar.is_trade_date(D(2024, 10, 1))
+    assert market_calendar.previous_trade_dates(D(2024, 10, 7), 2) == [D(2024, 10, 4), D(2024, 10, 7)]
+
+
+def test_fetch_range_before_and_after_open():
+    assert market_calendar.ashare_fetch_range(3, cst(2024, 10, 8, 9, 0)) == (D(2024, 9, 26), D(2024, 9, 30))
+    assert market_calendar.ashare_fetch_range(3, cst(2024, 10, 8, 10, 0)) == (D(2024, 9, 27), D(2024, 10, 8))
+
+
+def test_intraday_expiry_uses_refresh_buckets():
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 10, 2)) == cst(2024, 10, 8, 10, 5)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 11, 28)) == cst(2024, 10, 8, 11, 30)
+
+
+def test_lunch_expires_at_afternoon_open():
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 11, 30)) == cst(2024, 10, 8, 13, 0)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 12, 59, 59)) == cst(2024, 10, 8, 13, 0)
+
+
+def test_settle_window_keeps_refreshing_until_next_open():
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 15, 20)) == cst(2024, 10, 8, 15, 25)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 15, 27)) == cst(2024, 10, 8, 15, 30)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 15, 30)) == cst(2024, 10, 9, 9, 30)
+
+
+def test_closed_days_expire_at_next_open():
+    assert market_calendar.ashare_cache_expiry(cst(2024, 9, 30, 16, 0)) == cst(2024, 10, 8, 9, 30)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 3, 12, 0)) == cst(2024, 10, 8, 9, 30)
+    assert market_calendar.ashare_cache_expiry(cst(2024, 10, 8, 9, 0)) == cst(2024, 10, 8, 9, 30)
+    # 无时区的时间按北京时间处理
+    assert market_calendar.ashare_cache_expiry(datetime.datetime(2024, 10, 8, 9, 0)) == cst(2024, 10, 8, 9, 30)
+
+
+def test_index_date_rolls_over_after_settle():
+    assert market_calendar.ashare_index_date(cst(2024, 9, 30, 15, 29)) == D(2024, 9, 30)
+    assert market_calendar.ashare_index_date(cst(2024, 9, 30, 15, 30)) == D(2024, 10, 8)
+    assert market_calendar.ashare_index_date(cst(2024, 10, 5, 10, 0)) == D(2024, 10, 8)
+    # 证券列表在收盘修正结束时失效，而不是与开盘时刻的行情缓存同时失效
+    assert market_calendar.ashare_index_expiry(D(2024, 10, 8)) == cst(2024, 10, 8, 15, 30)
+
+
+def test_crypto_expiry_aligns_to_candle_close():
+    assert market_calendar.crypto_cache_expiry('1h', utc(2024, 10, 8, 10, 2)) == utc(2024, 10, 8, 10, 5)
+    assert market_calendar.crypto_cache_expiry('1h', utc(2024, 10, 8, 10, 58, 30)) == utc(2024, 10, 8, 11, 0)
+    assert market_calendar.crypto_cache_expiry('1m', utc(2024, 10, 8, 10, 2, 30)) == utc(2024, 10, 8, 10, 3)
+
+
+def test_crypto_fetch_since_starts_at_candle_open():
+    since = market_calendar.crypto_fetch_since('4h', 1, utc(2024, 10, 8, 10, 30))
+    assert since == int(utc(2024, 10, 7, 8, 0).timestamp()) * 1000